@@ -0,0 +1,90 @@
+"""
+Admission control: pick how much work a new turn may cost under the current load.
+
+    level = controller.level()
+    if level >= REJECT:
+        ...  # refuse the turn
+    with controller.track('gemini'):
+        ...  # remote call
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+NORMAL, LOCAL_TAGS, SHORT_REPLIES, REJECT = range(4)
+LEVEL_NAMES = {
+    NORMAL: "normal",
+    LOCAL_TAGS: "local tags",
+    SHORT_REPLIES: "local tags, short replies",
+    REJECT: "overloaded",
+}
+
+
+class AdmissionController:
+    """
+    Degradation level from the remote calls in flight and their recent latency.
+
+    `inflight_levels` and `latency_levels` are the thresholds at which
+    LOCAL_TAGS, SHORT_REPLIES and REJECT start: the number of tracked calls
+    in flight, and the p95 duration in seconds of calls that finished in the
+    last `window_seconds`. Latency is kept per kind of call and the slowest
+    kind counts, so a slow tagger is not averaged away by fast replies. The
+    higher of the two readings wins, so either a queue building up or calls
+    slowing down sheds load.
+    """
+
+    def __init__(self, inflight_levels=(48, 96, 160), latency_levels=(10.0, 20.0, 40.0),
+                 window_seconds: float = 30.0, clock=time.monotonic):
+        self.inflight_levels = tuple(inflight_levels)
+        self.latency_levels = tuple(latency_levels)
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._in_flight = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, kind: str = 'remote'):
+        """Count the enclosed remote call of `kind` as in flight, and record its duration when it ends."""
+        start = self._clock()
+        with self._lock:
+            self._in_flight[kind] = self._in_flight.get(kind, 0) + 1
+        try:
+            yield
+        finally:
+            end = self._clock()
+            with self._lock:
+                self._in_flight[kind] -= 1
+                self._recent.setdefault(kind, deque()).append((end, end - start))
+
+    def _latency_p95(self, kind: str) -> float:
+        # Caller holds the lock
+        recent = self._recent.get(kind)
+        if not recent:
+            return 0.0
+        cutoff = self._clock() - self.window_seconds
+        while recent and recent[0][0] < cutoff:
+            recent.popleft()
+        if not recent:
+            return 0.0
+        durations = sorted(duration for _, duration in recent)
+        return durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            kinds = {
+                kind: {'in_flight': self._in_flight.get(kind, 0), 'latency_p95': self._latency_p95(kind)}
+                for kind in set(self._in_flight) | set(self._recent)
+            }
+        in_flight = sum(stats['in_flight'] for stats in kinds.values())
+        latency = max((stats['latency_p95'] for stats in kinds.values()), default=0.0)
+        level = max(
+            sum(in_flight >= threshold for threshold in self.inflight_levels),
+            sum(latency >= threshold for threshold in self.latency_levels),
+        )
+        return {'level': level, 'name': LEVEL_NAMES[level], 'in_flight': in_flight, 'latency_p95': latency,
+                'kinds': kinds}
+
+    def level(self) -> int:
+        return self.snapshot()['level']
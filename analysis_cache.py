@@ -0,0 +1,122 @@
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(messages: list) -> str:
+    """Stable hash of a conversation, using only each message's role and content."""
+    normalized = [
+        {'role': m.get('role', ''), 'content': m.get('content', '')}
+        for m in messages
+    ]
+    payload = json.dumps(normalized, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(analysis: dict) -> bool:
+    """Only clean remote results are cached - never errors or fallback results."""
+    return (
+        isinstance(analysis, dict)
+        and not analysis.get('error')
+        and not analysis.get('warning')
+        and not analysis.get('fallback')
+    )
+
+
+class AnalysisCache:
+    """
+    Thread-safe LRU + TTL cache for query analysis results.
+
+    Entries live in an in-memory LRU. When `path` is given, entries are also
+    written to a SQLite file so the cache survives restarts; memory misses
+    fall through to that tier and are promoted back into memory on a hit.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, path: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str, count: bool = True):
+        """Return the cached analysis for `key`, or None on a miss. `count=False` leaves the hit/miss stats alone."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += count
+                    return copy.deepcopy(value)
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM analysis_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self.hits += count
+                    return copy.deepcopy(value)
+
+            self.misses += count
+            return None
+
+    def put(self, key: str, analysis: dict):
+        """Cache `analysis` under `key` if it is a clean remote result."""
+        if not is_cacheable(analysis):
+            return
+        value = copy.deepcopy(analysis)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                self._db.commit()
+
+    def _store(self, key: str, value: dict, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM analysis_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,183 @@
+"""
+Headless HTTP API for the tagging pipeline, without the Streamlit script.
+
+A plain ASGI application with no framework dependency; serve it with any
+ASGI server:
+
+    uvicorn api:app --workers 4
+
+    POST /analyze        {"messages": [{"role": "user", "content": "..."}, ...]}
+                         -> {"expanded_query": "...", "topic": {"level_1": "...", "level_2": "..."}}
+    POST /analyze/batch  {"conversations": [[...], [...]]} -> {"results": [{...}, {...}]}
+    GET  /healthz        Modal circuit breaker state and cache stats
+    GET  /metrics        Prometheus metrics (/metrics.json for JSON)
+
+Requests go through the same AnalysisPipeline as the app - context window,
+analysis cache, single-flight, circuit breaker, Modal call and local
+fallback tags. It is configured from environment variables named like the
+secrets.toml settings (MODAL_TOKEN_ID and MODAL_TOKEN_SECRET for Modal,
+ANALYSIS_CACHE_PATH, TAGGER_BATCH_WINDOW_MS, ...). Point ANALYSIS_CACHE_PATH
+at the app's SQLite file to share cached analyses with it.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from metrics import REGISTRY as METRICS
+
+MAX_BODY_BYTES = 1024 * 1024
+ROLES = ('user', 'assistant')
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_conversation(value) -> list:
+    """Validate one conversation: a non-empty list of {'role', 'content'} dicts."""
+    if not isinstance(value, list) or not value:
+        raise RequestError(400, "a conversation must be a non-empty list of messages")
+    for message in value:
+        if (not isinstance(message, dict) or message.get('role') not in ROLES
+                or not isinstance(message.get('content'), str)):
+            raise RequestError(400, "each message needs a 'role' of 'user' or 'assistant' and a string 'content'")
+    return [{'role': m['role'], 'content': m['content']} for m in value]
+
+
+class TaggingAPI:
+    """ASGI application serving the analysis pipeline built from `config` (default: os.environ)."""
+
+    def __init__(self, config=None):
+        self.config = os.environ if config is None else config
+        self.max_body = int(self.config.get('API_MAX_BODY_BYTES', MAX_BODY_BYTES))
+        self.max_batch = int(self.config.get('API_MAX_BATCH', 64))
+        self._pipeline = None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            executor = ThreadPoolExecutor(
+                max_workers=int(self.config.get('API_REMOTE_WORKERS', 32)), thread_name_prefix="remote"
+            )
+            self._pipeline = settings.analysis_pipeline(
+                self.config, settings.modal_service(self.config), settings.analysis_cache(self.config), executor
+            )
+        return self._pipeline
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        try:
+            status, payload = await self._route(scope, receive)
+        except RequestError as e:
+            status, payload = e.status, {'error': str(e)}
+        except Exception as e:
+            METRICS.inc('api_errors_total')
+            status, payload = 500, {'error': f"internal error: {e}"}
+
+        if isinstance(payload, str):
+            await self._send(send, status, payload.encode('utf-8'), b'text/plain; version=0.0.4')
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            await self._send(send, status, body, b'application/json')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Resolve the Modal service before the first request instead of during it
+                await asyncio.to_thread(self.pipeline.handle.get_service)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._pipeline is not None:
+                    self._pipeline.handle.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _route(self, scope, receive):
+        method, path = scope['method'], scope['path']
+        routes = {
+            '/analyze': ('POST', self._analyze),
+            '/analyze/batch': ('POST', self._analyze_batch),
+            '/healthz': ('GET', self._healthz),
+            '/metrics': ('GET', self._metrics),
+            '/metrics.json': ('GET', self._metrics_json),
+        }
+        if path not in routes:
+            raise RequestError(404, "not found")
+        allowed, handler = routes[path]
+        if method != allowed:
+            raise RequestError(405, f"use {allowed}")
+        if allowed == 'POST':
+            return 200, await handler(await self._read_json(receive))
+        return 200, handler()
+
+    async def _read_json(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            body = message.get('body', b'')
+            size += len(body)
+            if size > self.max_body:
+                raise RequestError(413, f"request body over {self.max_body} bytes")
+            chunks.append(body)
+            if not message.get('more_body'):
+                break
+        try:
+            return json.loads(b''.join(chunks))
+        except ValueError:
+            raise RequestError(400, "request body is not valid JSON")
+
+    async def _analyze(self, request) -> dict:
+        if not isinstance(request, dict):
+            raise RequestError(400, "expected a JSON object with 'messages'")
+        messages = parse_conversation(request.get('messages'))
+        METRICS.inc('api_analyses_total')
+        with METRICS.span('api_analyze'):
+            return await self.pipeline.analyze_async(messages)
+
+    async def _analyze_batch(self, request) -> dict:
+        conversations = request.get('conversations') if isinstance(request, dict) else None
+        if not isinstance(conversations, list) or not conversations:
+            raise RequestError(400, "expected a JSON object with a non-empty 'conversations' list")
+        if len(conversations) > self.max_batch:
+            raise RequestError(413, f"at most {self.max_batch} conversations per batch")
+        conversations = [parse_conversation(c) for c in conversations]
+        METRICS.inc('api_analyses_total', len(conversations))
+        with METRICS.span('api_analyze_batch'):
+            results = await asyncio.gather(*(self.pipeline.analyze_async(c) for c in conversations))
+        return {'results': results}
+
+    def _healthz(self) -> dict:
+        pipeline = self.pipeline
+        return {
+            'status': 'ok',
+            'modal': pipeline.handle.breaker.snapshot(),
+            'cache': pipeline.cache.stats(),
+            'coalescing': pipeline.coalescing_stats(),
+        }
+
+    def _metrics(self) -> str:
+        return METRICS.to_prometheus()
+
+    def _metrics_json(self) -> dict:
+        return METRICS.snapshot()
+
+    async def _send(self, send, status: int, body: bytes, content_type: bytes):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = TaggingAPI()
@@ -1,11 +1,57 @@
+import time
+
+SCRIPT_START = time.perf_counter()
+
 import streamlit as st
-from google import genai
-from google.genai.types import HttpOptions
-from google.oauth2 import service_account
-import modal
-import html
-import json
+import asyncio
 import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+
+from admission import LOCAL_TAGS, NORMAL, REJECT, SHORT_REPLIES
+from async_backend import AsyncBackend
+from chat import stream_reply, stream_reply_async
+from circuit_breaker import CLOSED, OPEN
+from context_window import ContextPolicy, messages_needed, verbatim_messages
+from message_store import ConversationStore
+from metrics import REGISTRY as METRICS
+from metrics import start_file_exporter, start_http_exporter
+from rendering import user_message_html
+import settings
+from speculation import TurnCalls
+from tagging import get_fallback_analysis, warm_up_fallback
+from templates import TemplateLibrary
+
+# Imports are only slow on the first run in a process; later reruns find them in sys.modules
+METRICS.observe('script_imports', time.perf_counter() - SCRIPT_START)
+
+STYLE_PATH = os.path.join(os.path.dirname(__file__), 'assets', 'app.css')
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templete.jsonl')
+
+
+@st.cache_resource(show_spinner=False)
+def record_cold_start(_import_seconds: float):
+    """Runs once per server process: the first run's import time is the cold-start import cost."""
+    METRICS.set('cold_start_imports_seconds', _import_seconds)
+    return True
+
+
+@st.cache_resource(show_spinner=False)
+def load_styles() -> str:
+    """The app stylesheet as a minified <style> block, read once per process."""
+    with open(STYLE_PATH, 'r', encoding='utf-8') as f:
+        css = f.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s*([{};,])\s*', r'\1', re.sub(r'\s+', ' ', css))
+    return f"<style>{css.strip()}</style>"
+
+
+record_cold_start(time.perf_counter() - SCRIPT_START)
+
 # Page config - Wide layout
 
 os.environ["MODAL_TOKEN_ID"] = st.secrets["token_id"]
@@ -17,210 +63,84 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
-# Custom CSS - Dark themed professional style
-st.markdown("""
-<style>
-    /* Main container */
-    .main .block-container {
-        padding-top: 1rem;
-        padding-bottom: 1rem;
-        max-width: 1200px;
-    }
-
-    /* Chat message styling - compact */
-    .stChatMessage {
-        padding-top: 1rem !important;
-        padding-bottom: 2rem !important;
-        margin-bottom: 0rem !important;
-    }
-
-    .stChatMessage > div {
-        padding: 0 !important;
-    }
-
-    /* User message container */
-    .user-message-container {
-        position: relative;
-        width: 100%;
-        display: flex;
-        flex-direction: column;
-        gap: 4px;
-    }
-
-    /* Top row: message text and topic tags */
-    .message-top-row {
-        display: flex;
-        align-items: flex-start;
-        justify-content: space-between;
-        gap: 12px;
-        width: 100%;
-    }
-
-    /* Message text area */
-    .message-text-area {
-        flex: 1;
-        color: #ffffff;
-        font-size: 0.9rem;
-        line-height: 1.5;
-        padding: 0;
-        min-width: 0;
-    }
-
-    /* Topic tag - top right corner */
-    .topic-tag-container {
-        display: flex;
-        align-items: center;
-        gap: 4px;
-        background: #1a1a1a;
-        border: 1px solid #2a2a2a;
-        border-radius: 4px;
-        padding: 4px 8px;
-        font-size: 0.7rem;
-        flex-shrink: 0;
-    }
-
-    .topic-badge {
-        background: #2d2d2d;
-        color: #ffffff;
-        padding: 4px 10px;
-        border-radius: 4px;
-        font-size: 0.7rem;
-        font-weight: 500;
-        white-space: nowrap;
-    }
-
-    .topic-badge.active {
-        background: #2563eb;
-        color: #ffffff;
-    }
-
-    .topic-sep {
-        color: #666;
-        font-size: 0.7rem;
-        margin: 0 2px;
-    }
-
-    /* Expanded query - large highlighted box */
-    .expanded-query-container {
-        width: 100%;
-        padding: 5px 16px;
-        background: #1a1a1a;
-        border: 1px solid #2a2a2a;
-        border-radius: 6px;
-        border-left: 4px solid #4a9eff;
-        margin-top: 0px;
-    }
-
-    .expanded-query-label {
-        font-size: 0.7rem;
-        font-weight: 700;
-        color: #888;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-        margin-bottom: 8px;
-    }
-
-    .expanded-query-value {
-        color: #ffffff;
-        font-size: 0.9rem;
-        line-height: 1.5;
-        font-weight: 400;
-    }
-
-    /* Header */
-    .main-header {
-        text-align: center;
-        padding: 0.5rem 0 1.5rem 0;
-        border-bottom: 1px solid #333;
-        margin-bottom: 1rem;
-    }
-
-    .main-header h1 {
-        font-size: 1.5rem;
-        font-weight: 600;
-        margin: 0;
-    }
-
-    .main-header p {
-        color: #888;
-        font-size: 0.875rem;
-        margin: 4px 0 0 0;
-    }
-
-    /* Status badge */
-    .status-badge {
-        display: inline-flex;
-        align-items: center;
-        gap: 4px;
-        padding: 4px 8px;
-        border-radius: 4px;
-        font-size: 0.75rem;
-        font-weight: 500;
-    }
-
-    .status-badge.success {
-        background: #1a3d1a;
-        color: #4ade80;
-    }
-
-    .status-badge.warning {
-        background: #3d2e1a;
-        color: #fbbf24;
-    }
-
-    /* Suggestion button */
-    button[kind="secondary"]:has(p:first-child) {
-        font-size: 0.85rem !important;
-    }
-
-    /* Dismiss X button - target by key */
-    button[data-testid="baseButton-secondary"] {
-        background: transparent !important;
-        border: 1px solid #ef4444 !important;
-        color: #ef4444 !important;
-        padding: 2px 8px !important;
-        min-height: unset !important;
-        font-size: 0.8rem !important;
-    }
-
-    button[data-testid="baseButton-secondary"]:hover {
-        background: rgba(239, 68, 68, 0.15) !important;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# System instruction
-SYSTEM_INSTRUCTION = """You are a helpful AI assistant. Engage in natural conversation with the user.
-Keep your responses concise but informative. Be friendly and helpful."""
-
-# Topic hierarchy
-TOPIC_HIERARCHY = {
-    "Politics": ["India", "UK", "USA", "China", "Russia", "Global"],
-    "Sports": ["Cricket", "Football", "Basketball", "Tennis", "Olympics"],
-    "Technology": ["Artificial Intelligence", "Machine Learning", "Software Development", "Cybersecurity", "Blockchain"],
-    "Business": ["Startups", "Finance", "Stock Market", "Economy", "E-commerce"],
-    "Entertainment": ["Movies", "TV Shows", "Music", "Celebrities", "OTT Platforms"],
-    "Science": ["Physics", "Biology", "Space", "Climate", "Research"],
-    "Health": ["Fitness", "Nutrition", "Mental Health", "Diseases", "Medicine"],
-    "Education": ["Exams", "Universities", "Online Courses", "Careers", "Research"],
-    "General": ["Chitchat", "Greetings", "Meta", "Clarification", "Other"]
-}
-
-
-@st.cache_data
+# Custom CSS - Dark themed professional style. Streamlit removes any element a
+# rerun does not emit again, so the stylesheet is still sent every run; it is
+# read and minified once per process to keep that message small.
+st.markdown(load_styles(), unsafe_allow_html=True)
+
+
+@st.cache_resource
+def get_context_policy(name: str) -> ContextPolicy:
+    """Context window policy for 'TAGGER' or 'CHAT', overridable in secrets."""
+    return settings.context_policy(st.secrets, name)
+
+
+def new_conversation_store() -> ConversationStore:
+    """
+    Per-session message store that spills turns beyond MESSAGE_MEMORY_WINDOW to disk.
+
+    The turns the models see verbatim always stay in memory, and older ones
+    they see compressed keep an in-memory digest, so a turn never reads disk.
+    """
+    policies = [get_context_policy(name) for name in ('CHAT', 'TAGGER')]
+    return ConversationStore(
+        memory_window=int(st.secrets.get('MESSAGE_MEMORY_WINDOW', 50)),
+        spill_dir=st.secrets.get('MESSAGE_SPILL_DIR') or None,
+        keep_recent=max(verbatim_messages(policy) for policy in policies),
+        digest_chars=max(policy.compressed_chars for policy in policies),
+        digest_count=max(messages_needed(policy) for policy in policies)
+    )
+
+
+@st.cache_resource
+def get_template_library(path: str, mtime_ns: int) -> TemplateLibrary:
+    """Template index for one version of the file; a changed mtime builds a new one."""
+    index_path = st.secrets.get('TEMPLATE_INDEX_PATH') or f"{path}.idx"
+    return TemplateLibrary(path, index_path=index_path)
+
+
 def load_templates():
-    """Load conversation templates from jsonl file."""
-    templates = []
-    template_path = os.path.join(os.path.dirname(__file__), 'templete.jsonl')
+    """Load the conversation template index for the jsonl file."""
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    templates.append(json.loads(line))
+        return get_template_library(TEMPLATE_PATH, os.stat(TEMPLATE_PATH).st_mtime_ns)
     except Exception as e:
         st.error(f"Failed to load templates: {e}")
-    return templates
+        return None
+
+
+def render_template_picker(templates: TemplateLibrary):
+    """Searchable, paginated template list; only one page of buttons is rendered."""
+    page_size = int(st.secrets.get('TEMPLATE_PAGE_SIZE', 10))
+    query = st.text_input("Search templates", key="template_query", placeholder="Search templates")
+    topics = templates.topics()
+    topic = st.selectbox(
+        "Topic", [None] + topics, key="template_topic",
+        format_func=lambda t: "All topics" if t is None else f"{t[0]} / {t[1]}"
+    )
+    matches = templates.search(query, topic)
+    if not matches:
+        st.caption("No matching templates")
+        return
+
+    pages = (len(matches) + page_size - 1) // page_size
+    if st.session_state.get('template_page', 1) > pages:
+        # The result set shrank under the current page
+        st.session_state.template_page = 1
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="template_page")
+    start = (page - 1) * page_size
+    for template_id in matches[start:start + page_size]:
+        topic_label = templates.topic(template_id)
+        if st.button(
+            templates.titles[template_id],
+            key=f"template_{template_id}",
+            help=" / ".join(topic_label) if topic_label else None,
+            use_container_width=True
+        ):
+            load_template_to_chat(templates.get(template_id))
+            st.rerun()
+    st.caption(f"{len(matches)} of {len(templates)} templates")
 
 
 def load_template_to_chat(template: dict):
@@ -228,7 +148,8 @@ def load_template_to_chat(template: dict):
     messages = template.get('messages', [])
 
     # Build the session messages (all except the last user message)
-    st.session_state.messages = []
+    discard_speculation()
+    st.session_state.messages = new_conversation_store()
     st.session_state.suggestion = None
 
     for i, msg in enumerate(messages):
@@ -241,151 +162,127 @@ def load_template_to_chat(template: dict):
                 'content': msg['content']
             })
 
+    if st.session_state.suggestion:
+        start_speculation(st.session_state.suggestion)
+
+
+def start_turn_calls(history: list, level: int = NORMAL) -> TurnCalls:
+    """Start the analysis and the reply for a conversation ending in a user message, degraded to `level`."""
+    short = level >= SHORT_REPLIES
+    if st.secrets.get('ASYNC_BACKEND', True):
+        # Resolve the cached factories here: building one on the loop thread would stall every session's calls
+        admission = get_admission_controller()
+        if level >= LOCAL_TAGS:
+            analyze = get_local_analysis_async
+        else:
+            analyze = partial(get_query_analysis_async, pipeline=get_analysis_pipeline())
+        policy, config = get_chat_settings(short)
+        stream = partial(
+            stream_gemini_response_async, client=get_genai_client(), policy=policy, config=config,
+            prefix_cache=get_prefix_cache(), admission=admission
+        )
+        return TurnCalls.on_loop(get_async_backend(), history, analyze, stream)
+    analyze = get_local_analysis if level >= LOCAL_TAGS else get_query_analysis
+    return TurnCalls.on_executor(
+        get_turn_executor(), history, analyze, partial(stream_gemini_response, short=short)
+    )
+
+
+def model_history() -> list:
+    """The newest messages the CHAT and TAGGER context policies can use, older ones as digests."""
+    count = max(messages_needed(get_context_policy(name)) for name in ('CHAT', 'TAGGER'))
+    return st.session_state.messages.context_tail(count)
+
+
+def start_speculation(prompt: str):
+    """Run the suggested next turn in the background, so clicking the suggestion shows results at once."""
+    # Speculative work is the first thing to go under load
+    if not st.secrets.get('SPECULATIVE_PREFETCH', True) or get_admission_controller().level() > NORMAL:
+        return
+    history = model_history() + [{'role': 'user', 'content': prompt}]
+    st.session_state.speculation = start_turn_calls(history)
+    METRICS.inc('speculations_started_total')
+
+
+def discard_speculation():
+    speculation = st.session_state.pop('speculation', None)
+    if speculation is not None:
+        speculation.cancel()
+        METRICS.inc('speculations_discarded_total')
+
 
 @st.cache_resource
 def get_modal_service():
-    """Get the Modal service for query expansion and topic tagging."""
-    try:
-        QueryExpansionService = modal.Cls.from_name(
-            "query-expansion-topic-tagging",  # app name
-            "QueryExpansionService"           # class name
-        )
-        return QueryExpansionService()
-    except Exception as e:
-        # Return None silently - error will be handled in get_query_analysis
-        return None
+    """Get the Modal service handle for query expansion and topic tagging, with its circuit breaker."""
+    return settings.modal_service(st.secrets)
+
+
+@st.cache_resource
+def get_analysis_cache():
+    """Process-wide cache of analysis results, shared by all sessions."""
+    return settings.analysis_cache(st.secrets)
+
+
+@st.cache_resource
+def get_analysis_pipeline():
+    """The query analysis pipeline, shared by all sessions."""
+    return settings.analysis_pipeline(
+        st.secrets, get_modal_service(), get_analysis_cache(), get_remote_executor(), get_admission_controller()
+    )
+
+
+@st.cache_resource
+def get_admission_controller():
+    """Load tracker shared by all sessions; decides how far new turns are degraded."""
+    return settings.admission_controller(st.secrets)
 
 
 def get_query_analysis(messages: list) -> dict:
-    """
-    Get expanded query and topic classification from Modal service.
+    """Get expanded query and topic classification from Modal service."""
+    return get_analysis_pipeline().analyze(messages)
 
-    Args:
-        messages: List of message dicts with 'role' and 'content' keys
 
-    Returns:
-        dict with 'expanded_query', 'topic' (level_1, level_2), and optional 'error'
-    """
-    service = get_modal_service()
-    if service is None:
-        # Return empty strings with error - do not display topic tags and expanded query
-        return {
-            'expanded_query': '',
-            'topic': {},
-            'error': "Modal instance is not running. Please start the Modal service."
-        }
+async def get_query_analysis_async(messages: list, pipeline) -> dict:
+    """`get_query_analysis` on the async backend, with the pipeline resolved by the caller."""
+    return await pipeline.analyze_async(messages)
 
-    try:
-        # Call modal service with chat history
-        result = service.infer.remote(messages=messages)
-
-        # Check for errors
-        if isinstance(result, dict) and 'error' in result:
-            # Check if error indicates Modal instance is not running
-            error_msg = result.get('error', '').lower()
-            if 'not running' in error_msg or 'not found' in error_msg or 'connection' in error_msg:
-                # Return empty strings with error - do not display topic tags and expanded query
-                return {
-                    'expanded_query': '',
-                    'topic': {},
-                    'error': "Modal instance is not running. Please start the Modal service."
-                }
-            else:
-                # For other errors, use fallback with warning
-                fallback = get_fallback_analysis(messages)
-                fallback['warning'] = f"Modal service error: {result.get('error')}"
-                if 'raw_output' in result:
-                    fallback['raw_output'] = result['raw_output'][:100]
-                return fallback
-
-        # Extract labels from result
-        # Result should have 'labels' key with 'expanded_query' and 'topic'
-        labels = result.get('labels', {})
-        if not labels:
-            # If no labels, try to extract from the result directly
-            if 'expanded_query' in result:
-                labels = result
-            else:
-                fallback = get_fallback_analysis(messages)
-                fallback['warning'] = "Modal service returned unexpected format"
-                return fallback
-
-        expanded_query = labels.get('expanded_query', '')
-        if not expanded_query and messages:
-            expanded_query = messages[-1].get('content', '')
-
-        topic = labels.get('topic', {})
-        if not topic or 'level_1' not in topic:
-            topic = {'level_1': 'General', 'level_2': 'Other'}
-
-        return {
-            'expanded_query': expanded_query,
-            'topic': topic
-        }
-    except Exception as e:
-        # Check if exception indicates Modal instance is not running
-        error_str = str(e).lower()
-        if 'not running' in error_str or 'not found' in error_str or 'connection' in error_str or 'timeout' in error_str:
-            # Return empty strings with error - do not display topic tags and expanded query
-            return {
-                'expanded_query': '',
-                'topic': {},
-                'error': "Modal instance is not running. Please start the Modal service."
-            }
-        else:
-            fallback = get_fallback_analysis(messages)
-            fallback['warning'] = f"Error calling Modal service: {str(e)}"
-            return fallback
-
-
-def get_fallback_analysis(messages: list) -> dict:
-    """Fallback analysis if Modal service is unavailable."""
-    if not messages:
-        return {
-            'expanded_query': '',
-            'topic': {'level_1': 'General', 'level_2': 'Other'}
-        }
-    
-    last_message = messages[-1]
-    query = last_message.get('content', '')
-    
-    # Simple fallback logic
-    q = query.lower()
-    if any(word in q for word in ['movie', 'film', 'actor']):
-        topic = {'level_1': 'Entertainment', 'level_2': 'Movies'}
-    elif any(word in q for word in ['football', 'soccer', 'goal', 'cricket']):
-        topic = {'level_1': 'Sports', 'level_2': 'Football'}
-    elif any(word in q for word in ['code', 'programming', 'software']):
-        topic = {'level_1': 'Technology', 'level_2': 'Software Development'}
-    elif any(word in q for word in ['health', 'doctor', 'medicine']):
-        topic = {'level_1': 'Health', 'level_2': 'Medicine'}
-    elif any(word in q for word in ['pm', 'minister', 'election', 'government']):
-        topic = {'level_1': 'Politics', 'level_2': 'India'}
-    elif any(word in q for word in ['ai', 'machine learning', 'technology']):
-        topic = {'level_1': 'Technology', 'level_2': 'Artificial Intelligence'}
-    else:
-        topic = {'level_1': 'General', 'level_2': 'Chitchat'}
-    
-    # Simple expanded query (just return the query as-is for fallback)
-    expanded_query = query
-    
-    return {
-        'expanded_query': expanded_query,
-        'topic': topic
-    }
+
+def get_local_analysis(messages: list) -> dict:
+    """Locally generated tags, used instead of the Modal service under load."""
+    analysis = get_fallback_analysis(messages)
+    analysis['warning'] = "High load - showing locally generated tags."
+    return analysis
+
+
+async def get_local_analysis_async(messages: list) -> dict:
+    # The local classifier is CPU work - run it beside the loop, not on it
+    return await asyncio.to_thread(get_local_analysis, messages)
+
+
+def get_gemini_http_options():
+    from google.genai.types import HttpOptions
+
+    # Bound each Gemini request so a stalled call cannot hold a turn indefinitely
+    timeout_ms = int(float(st.secrets.get('GEMINI_TIMEOUT_SECONDS', 30)) * 1000)
+    return HttpOptions(api_version="v1", timeout=timeout_ms)
 
 
 @st.cache_resource
 def get_genai_client():
+    # google.genai and google.oauth2 take a while to import - only pay for them when a client is built
+    from google import genai
+
     use_vertex = st.secrets.get('GOOGLE_GENAI_USE_VERTEXAI', 'false').lower() == 'true'
 
     if use_vertex and 'gcp_service_account' in st.secrets:
+        from google.oauth2 import service_account
+
         credentials = service_account.Credentials.from_service_account_info(
             dict(st.secrets['gcp_service_account']),
             scopes=['https://www.googleapis.com/auth/cloud-platform']
         )
         client = genai.Client(
-            http_options=HttpOptions(api_version="v1"),
+            http_options=get_gemini_http_options(),
             vertexai=True,
             project=st.secrets.get('GOOGLE_CLOUD_PROJECT', 'stone-column-425217-n6'),
             location=st.secrets.get('GOOGLE_CLOUD_LOCATION', 'us-central1'),
@@ -396,35 +293,175 @@ def get_genai_client():
         if api_key:
             client = genai.Client(
                 api_key=api_key,
-                http_options=HttpOptions(api_version="v1")
+                http_options=get_gemini_http_options()
             )
         else:
             return None
     return client
 
 
-def get_gemini_response(messages: list) -> str:
+@st.cache_resource
+def get_remote_executor():
+    """Worker pool for remote tagger calls, including hedged duplicates."""
+    return ThreadPoolExecutor(max_workers=32, thread_name_prefix="remote")
+
+
+@st.cache_resource
+def get_async_backend():
+    """Event loop shared by all sessions for awaiting Modal and Gemini calls."""
+    return AsyncBackend()
+
+
+@st.cache_resource
+def get_turn_executor():
+    """Shared worker pool used to run the remote calls of a chat turn concurrently."""
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix="turn")
+
+
+@st.cache_resource
+def get_prefix_cache():
+    """Shared Gemini cached-content handles for conversation prefixes (None when disabled)."""
+    return settings.prefix_cache(st.secrets, get_genai_client())
+
+
+def get_chat_settings(short: bool = False):
+    """Context policy and Gemini config for a reply; `short` trims both for turns under load."""
+    if short:
+        return settings.short_reply_settings(st.secrets)
+    return get_context_policy('CHAT'), None
+
+
+def stream_gemini_response(messages: list, short: bool = False):
+    """Yield the Gemini reply as text chunks while it is being generated."""
     client = get_genai_client()
     if client is None:
         raise Exception("Gemini client not configured. Check secrets.toml")
+    policy, config = get_chat_settings(short)
+    with get_admission_controller().track('gemini'):
+        yield from stream_reply(client, messages, policy, config, prefix_cache=get_prefix_cache())
 
-    contents = [
-        {'role': 'user' if m['role'] == 'user' else 'model', 'parts': [{'text': m['content']}]}
-        for m in messages
-    ]
-
-    response = client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=contents,
-        config={
-            'system_instruction': SYSTEM_INSTRUCTION,
-            'temperature': 0.7,
-            'top_p': 0.95,
-            'top_k': 40,
-            'max_output_tokens': 1024,
-        }
-    )
-    return response.text
+
+async def stream_gemini_response_async(messages: list, client, policy, config, prefix_cache, admission):
+    """`stream_gemini_response` on the async backend, with the shared objects resolved by the caller."""
+    if client is None:
+        raise Exception("Gemini client not configured. Check secrets.toml")
+    with admission.track('gemini'):
+        async for chunk in stream_reply_async(client, messages, policy, config, prefix_cache=prefix_cache):
+            yield chunk
+
+
+def render_user_message(message: dict, avatar: str = "👦"):
+    """Render a stored user message with its analysis notices, topic tags and expanded query."""
+    analysis = message.get('analysis')
+    # Display error/warning for this message if any
+    if analysis and analysis.get('error'):
+        st.error(analysis['error'])
+    if analysis and analysis.get('warning'):
+        st.warning(analysis['warning'])
+        if analysis.get('raw_output'):
+            st.caption(f"Raw output: {analysis['raw_output']}...")
+    with st.chat_message("user", avatar=avatar):
+        if analysis and analysis.get('provisional'):
+            st.caption("Provisional tags - remote analysis is still running")
+        html_content = user_message_html(message)
+        if html_content:
+            st.markdown(html_content, unsafe_allow_html=True)
+        else:
+            st.write(message['content'])
+
+
+def render_message(message: dict):
+    if message['role'] == 'user':
+        render_user_message(message)
+    else:
+        with st.chat_message("assistant", avatar="🤖"):
+            st.write(message['content'])
+
+
+# st.fragment reruns only the decorated function on interactions inside it
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda f: f)
+
+
+@fragment
+def render_earlier_messages(messages: ConversationStore, count: int, page_size: int):
+    """Collapsed, paginated view of the first `count` messages, loaded a page at a time."""
+    if not st.toggle(f"Show {count} earlier messages", key="show_earlier_messages"):
+        return
+    pages = (count + page_size - 1) // page_size
+    # Page 1 is the most recent page of earlier messages
+    page = 1
+    if pages > 1:
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, key="earlier_messages_page")
+    end = count - (page - 1) * page_size
+    for message in messages[max(0, end - page_size):end]:
+        render_message(message)
+
+
+def render_history(messages: ConversationStore):
+    """Render the chat history, keeping only the last HISTORY_WINDOW messages live."""
+    window = int(st.secrets.get('HISTORY_WINDOW', 20))
+    if len(messages) > window:
+        render_earlier_messages(messages, len(messages) - window, window)
+    for message in messages.tail(window):
+        render_message(message)
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """
+    Once per server process, build the shared backends in the background -
+    Modal lookup, Gemini client, event loop, template index and local
+    classifier - so the first turn does not pay for them.
+    """
+    def warm():
+        start = time.perf_counter()
+        steps = (
+            ('modal', lambda: get_modal_service().get_service()),
+            ('gemini', get_genai_client),
+            ('prefix_cache', get_prefix_cache),
+            ('async_backend', get_async_backend),
+            ('pipeline', get_analysis_pipeline),
+            ('templates', lambda: get_template_library(TEMPLATE_PATH, os.stat(TEMPLATE_PATH).st_mtime_ns)),
+            ('fallback', warm_up_fallback),
+        )
+        for name, step in steps:
+            try:
+                with METRICS.span(f'warmup_{name}'):
+                    step()
+            except Exception:
+                METRICS.inc('warmup_errors_total')
+        METRICS.set('startup_warmup_seconds', time.perf_counter() - start)
+
+    thread = threading.Thread(target=warm, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_resource
+def start_metrics_export():
+    """Start the configured metrics exporters once per process."""
+    port = st.secrets.get('METRICS_PORT')
+    if port:
+        start_http_exporter(int(port))
+    path = st.secrets.get('METRICS_FILE')
+    if path:
+        start_file_exporter(path)
+    return True
+
+
+def render_metrics_panel():
+    """Sidebar debug panel with per-stage latency percentiles and counters."""
+    snapshot = METRICS.snapshot()
+    with st.expander("Metrics"):
+        for name, stats in sorted(snapshot['latency_seconds'].items()):
+            st.caption(
+                f"{name}: p50 {stats['p50'] * 1000:.0f}ms · p95 {stats['p95'] * 1000:.0f}ms · "
+                f"p99 {stats['p99'] * 1000:.0f}ms ({stats['count']})"
+            )
+        for name, value in sorted(snapshot['counters'].items()):
+            st.caption(f"{name}: {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            st.caption(f"{name}: {value:.3f}")
 
 
 def main():
@@ -436,7 +473,7 @@ def main():
     """, unsafe_allow_html=True)
 
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = new_conversation_store()
 
     # Sidebar - Templates
     with st.sidebar:
@@ -445,57 +482,41 @@ def main():
         templates = load_templates()
 
         if templates:
-            for i, template in enumerate(templates):
-                if st.button(f"Template {i + 1}", key=f"template_{i}", use_container_width=True):
-                    load_template_to_chat(template)
-                    st.rerun()
+            render_template_picker(templates)
         else:
             st.caption("No templates found")
 
         st.divider()
+        breaker = get_modal_service().breaker.snapshot()
+        if breaker['state'] == CLOSED:
+            st.markdown('<span class="status-badge success">Modal service: online</span>', unsafe_allow_html=True)
+        elif breaker['state'] == OPEN:
+            st.markdown(
+                f'<span class="status-badge warning">Modal service: offline - retrying in {breaker["retry_in"]:.0f}s</span>',
+                unsafe_allow_html=True
+            )
+        else:
+            st.markdown('<span class="status-badge warning">Modal service: reconnecting</span>', unsafe_allow_html=True)
+        load = get_admission_controller().snapshot()
+        badge = 'success' if load['level'] == NORMAL else 'warning'
+        st.markdown(f'<span class="status-badge {badge}">Load: {load["name"]}</span>', unsafe_allow_html=True)
+        cache_stats = get_analysis_cache().stats()
+        flight_stats = get_analysis_pipeline().coalescing_stats()
+        st.caption(
+            f"Analysis cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses · "
+            f"{flight_stats['shared']} shared calls"
+        )
+        if st.secrets.get('METRICS_PANEL', False):
+            render_metrics_panel()
         if st.button("Clear Chat", use_container_width=True):
-            st.session_state.messages = []
+            discard_speculation()
+            st.session_state.messages.clear()
             st.session_state.suggestion = None
             st.rerun()
 
     # Chat area
-    for msg in st.session_state.messages:
-        if msg['role'] == 'user':
-            analysis = msg.get('analysis')
-            # Display error/warning for this message if any
-            if analysis and analysis.get('error'):
-                st.error(analysis['error'])
-            if analysis and analysis.get('warning'):
-                st.warning(analysis['warning'])
-            with st.chat_message("user", avatar="👦"):
-                if analysis:
-                    # Build topic tags HTML only if topic exists and has valid values
-                    topic_html = ""
-                    topic = analysis.get('topic')
-                    if topic and isinstance(topic, dict) and topic.get('level_1') and topic.get('level_2'):
-                        topic_html = f'<div class="topic-tag-container"><span class="topic-badge">{html.escape(str(topic["level_1"]))}</span><span class="topic-sep">›</span><span class="topic-badge active">{html.escape(str(topic["level_2"]))}</span></div>'
-
-                    # Build expanded query HTML only if expanded_query exists and is not empty
-                    expanded_query_html = ""
-                    expanded_query = analysis.get('expanded_query')
-                    if expanded_query and expanded_query != "":
-                        expanded_query_html = f'<div class="expanded-query-container"><div class="expanded-query-label">EXPANDED QUERY</div><div class="expanded-query-value">{html.escape(str(expanded_query))}</div></div>'
-
-                    # Only show formatted message if we have at least topic or expanded query
-                    has_topic = bool(topic_html)
-                    has_expanded = bool(expanded_query_html)
-
-                    if has_topic or has_expanded:
-                        # Build the HTML structure conditionally
-                        html_content = f'<div class="user-message-container"><div class="message-top-row"><div class="message-text-area">{html.escape(str(msg["content"]))}</div>{topic_html if has_topic else ""}</div>{expanded_query_html if has_expanded else ""}</div>'
-                        st.markdown(html_content, unsafe_allow_html=True)
-                    else:
-                        st.write(msg['content'])
-                else:
-                    st.write(msg['content'])
-        else:
-            with st.chat_message("assistant", avatar="🤖"):
-                st.write(msg['content'])
+    with METRICS.span('render_history'):
+        render_history(st.session_state.messages)
 
     # Show suggestion if available
     if 'suggestion' in st.session_state and st.session_state.suggestion:
@@ -508,6 +529,7 @@ def main():
                 st.rerun()
         with col2:
             if st.button("✕", key="dismiss_suggestion", type="secondary"):
+                discard_speculation()
                 st.session_state.suggestion = None
                 st.rerun()
 
@@ -524,71 +546,126 @@ def main():
     if not prompt:
         prompt = chat_input
 
+    level = get_admission_controller().level() if prompt else NORMAL
+    if prompt and level >= REJECT:
+        # Shed the turn before it costs anything; keep the text so it can be resent in one click
+        METRICS.inc('turns_rejected_total')
+        discard_speculation()
+        st.error("The service is overloaded right now - please try again in a moment.")
+        st.session_state.suggestion = prompt
+        prompt = None
+
     if prompt:
+        if level > NORMAL:
+            METRICS.inc(f'turns_degraded_level_{level}_total')
         # Add user message first (without analysis)
-        user_message = {
+        user_message = st.session_state.messages.append({
             'role': 'user',
             'content': prompt
-        }
-        st.session_state.messages.append(user_message)
-        
-        # Get analysis from Modal service with full chat history
-        with st.spinner("Analyzing query..."):
-            analysis = get_query_analysis(st.session_state.messages)
-
-        # Display error or warning messages from analysis
-        if analysis.get('error'):
-            st.error(analysis['error'])
-        if analysis.get('warning'):
-            st.warning(analysis['warning'])
-            if analysis.get('raw_output'):
-                st.caption(f"Raw output: {analysis['raw_output']}...")
-
-        # Update the user message with analysis
-        st.session_state.messages[-1]['analysis'] = analysis
-
-        with st.chat_message("user", avatar="🐿️"):
-            # Build topic tags HTML only if topic exists and has valid values
-            topic_html = ""
-            if analysis:
-                topic = analysis.get('topic')
-                if topic and isinstance(topic, dict) and topic.get('level_1') and topic.get('level_2'):
-                    topic_html = f'<div class="topic-tag-container"><span class="topic-badge">{html.escape(str(topic["level_1"]))}</span><span class="topic-sep">›</span><span class="topic-badge active">{html.escape(str(topic["level_2"]))}</span></div>'
-                
-                # Build expanded query HTML only if expanded_query exists and is not empty
-                expanded_query_html = ""
-                expanded_query = analysis.get('expanded_query')
-                if expanded_query and expanded_query != "":
-                    expanded_query_html = f'<div class="expanded-query-container"><div class="expanded-query-label">EXPANDED QUERY</div><div class="expanded-query-value">{html.escape(str(expanded_query))}</div></div>'
-            
-            # Only show formatted message if we have at least topic or expanded query
-            has_topic = bool(topic_html)
-            has_expanded = bool(expanded_query_html)
-            
-            if has_topic or has_expanded:
-                # Build the HTML structure conditionally
-                html_content = f'<div class="user-message-container"><div class="message-top-row"><div class="message-text-area">{html.escape(str(prompt))}</div>{topic_html if has_topic else ""}</div>{expanded_query_html if has_expanded else ""}</div>'
-                st.markdown(html_content, unsafe_allow_html=True)
-            else:
-                st.write(prompt)
+        })
+
+        # Start analysis in the background - the reply does not depend on it.
+        history = model_history()
+        speculation = st.session_state.pop('speculation', None)
+        if speculation is not None and speculation.matches(history):
+            # The suggestion was sent as predicted - its calls have been running since the template loaded
+            METRICS.inc('speculation_hits_total')
+            turn = speculation
+        else:
+            if speculation is not None:
+                speculation.cancel()
+                METRICS.inc('speculations_discarded_total')
+            turn = start_turn_calls(history, level)
+        analysis_future = turn.analysis
+        analysis_deadline = time.monotonic() + float(st.secrets.get('TAGGER_BUDGET_SECONDS', 1.5))
+        analysis_lock = threading.Lock()
+
+        def settle_analysis(future):
+            # Runs when the remote analysis lands, possibly after this run has finished:
+            # it replaces any provisional tags on the stored message
+            with analysis_lock:
+                user_message['analysis'] = future.result()
+
+        analysis_future.add_done_callback(settle_analysis)
+
+        # Reserve a slot so the analysis renders in place as soon as it is ready
+        user_slot = st.empty()
+
+        with user_slot.container():
+            render_user_message(user_message, avatar="🐿️")
+
+        rendered_analysis = [None]
+
+        def refresh_analysis():
+            """Re-render the user message when its analysis changes; True once the final analysis is shown."""
+            with analysis_lock:
+                analysis = user_message.get('analysis')
+                if analysis is None and analysis_future.done():
+                    analysis = user_message['analysis'] = analysis_future.result()
+                if analysis is None and time.monotonic() >= analysis_deadline:
+                    # Over budget - show local tags now and swap in the remote ones when they arrive
+                    METRICS.inc('provisional_analyses_total')
+                    analysis = get_fallback_analysis(history)
+                    analysis['provisional'] = True
+                    user_message['analysis'] = analysis
+            if analysis is not None and analysis is not rendered_analysis[0]:
+                with user_slot.container():
+                    render_user_message(user_message, avatar="🐿️")
+                rendered_analysis[0] = analysis
+            return analysis is not None and not analysis.get('provisional')
+
+        # The reply is generated on the executor so the script thread can keep
+        # the analysis deadline while chunks arrive
+        chunks = turn.chunks
 
         with st.chat_message("assistant", avatar="🤖"):
-            with st.spinner("Thinking..."):
+            reply_slot = st.empty()
+            reply_slot.caption("Thinking...")
+            response = ""
+            analysis_settled = False
+            while True:
+                timeout = None
+                if not analysis_settled:
+                    analysis_settled = refresh_analysis()
+                    if not analysis_settled:
+                        timeout = max(0.05, analysis_deadline - time.monotonic())
                 try:
-                    response = get_gemini_response(st.session_state.messages)
-                    st.write(response)
-                    st.session_state.messages.append({
-                        'role': 'assistant',
-                        'content': response
-                    })
-                except Exception as e:
-                    error_msg = f"Error: {str(e)}"
+                    item = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    reply_slot.markdown(response)
+                    break
+                if isinstance(item, Exception):
+                    METRICS.inc('gemini_errors_total')
+                    error_msg = f"Error: {str(item)}"
+                    if response:
+                        # Keep what was generated before the stream broke off
+                        reply_slot.markdown(response)
+                        response = f"{response}\n\n{error_msg}"
+                    else:
+                        reply_slot.empty()
+                        response = error_msg
                     st.error(error_msg)
-                    st.session_state.messages.append({
-                        'role': 'assistant',
-                        'content': error_msg
-                    })
+                    break
+                response += item
+                reply_slot.markdown(response + "▌")
+
+        # The reply finished first - wait for the analysis until its budget runs out
+        while not refresh_analysis() and 'analysis' not in user_message:
+            try:
+                analysis_future.result(timeout=max(0.0, analysis_deadline - time.monotonic()))
+            except FutureTimeoutError:
+                pass
+
+        st.session_state.messages.append({
+            'role': 'assistant',
+            'content': response
+        })
 
 
 if __name__ == "__main__":
-    main()
+    start_metrics_export()
+    start_warmup()
+    with METRICS.span('script_run'):
+        main()
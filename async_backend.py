@@ -0,0 +1,47 @@
+"""
+One long-lived asyncio event loop for the remote calls of all sessions.
+
+Streamlit scripts are synchronous, so a session hands a coroutine to the
+shared loop and waits on the concurrent.futures.Future it gets back:
+
+    backend = AsyncBackend()
+    analysis = backend.submit(pipeline.analyze_async(messages)).result()
+
+A call waiting on the network is then a coroutine on the loop rather than
+a blocked server thread. The async Modal and google-genai clients bind
+their HTTP sessions to the loop they first run on, so keeping one loop
+for the life of the process keeps their connection pools warm.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class AsyncBackend:
+    def __init__(self, name: str = 'async-backend'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> Future:
+        """Schedule `coro` on the loop. Cancelling the returned future cancels the coroutine."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """Run `coro` on the loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+async def call_remote(method, **kwargs):
+    """Await a Modal method call, with `.remote.aio` where the SDK has it, else `.remote` on a worker thread."""
+    aio = getattr(method.remote, 'aio', None)
+    if aio is not None:
+        return await aio(**kwargs)
+    return await asyncio.to_thread(method.remote, **kwargs)
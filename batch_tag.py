@@ -0,0 +1,197 @@
+"""
+Tag a JSONL file of conversations offline with the Modal QueryExpansionService.
+
+Each input line is a conversation in the template format ({"messages": [...]}).
+Each output line holds the analysis for the input line at the same position:
+
+    {"line": 0, "expanded_query": "...", "topic": {"level_1": "...", "level_2": "..."}}
+
+The input is streamed, so files of any size can be processed. Up to
+--concurrency calls are in flight at once and results are written in input
+order. Progress is checkpointed next to the output file, so re-running the
+same command after an interruption resumes where it stopped.
+
+Usage:
+    python batch_tag.py conversations.jsonl tags.jsonl --concurrency 64
+    python batch_tag.py conversations.jsonl tags.jsonl --local
+"""
+import argparse
+import json
+import os
+import sys
+from collections import deque
+
+from context_window import ContextPolicy, apply_context_policy
+from tagging import (
+    MODAL_APP_NAME,
+    MODAL_CLASS_NAME,
+    get_fallback_analyses,
+    interpret_exception,
+    interpret_result,
+)
+
+
+def read_conversations(f, skip: int = 0):
+    """Yield (line_number, messages or error) for each non-blank line, skipping the first `skip` lines."""
+    for line_number, line in enumerate(f):
+        if line_number < skip:
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            messages = json.loads(line).get('messages', [])
+        except (ValueError, AttributeError) as e:
+            yield line_number, ValueError(f"Invalid conversation: {e}")
+            continue
+        if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+            yield line_number, ValueError("Invalid conversation: 'messages' must be a list of objects")
+            continue
+        yield line_number, messages
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'next_line': 0, 'output_bytes': 0}
+
+
+def save_checkpoint(path: str, next_line: int, output_bytes: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'next_line': next_line, 'output_bytes': output_bytes}, f)
+    os.replace(tmp_path, path)
+
+
+def tag_file(input_path: str, output_path: str, service, policy: ContextPolicy,
+             concurrency: int = 32, checkpoint_every: int = 100, timeout: float = 300):
+    """Tag every conversation in `input_path`, resuming from the checkpoint if there is one."""
+    checkpoint_path = f"{output_path}.checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    # Drop any output written after the last checkpoint
+    mode = 'r+b' if os.path.exists(output_path) else 'wb'
+    with open(input_path, 'r', encoding='utf-8') as input_file, open(output_path, mode) as output_file:
+        output_file.truncate(checkpoint['output_bytes'])
+        output_file.seek(checkpoint['output_bytes'])
+
+        pending = deque()
+        written = 0
+
+        def write_next():
+            nonlocal written
+            line_number, messages, call = pending.popleft()
+            if isinstance(call, Exception):
+                analysis = {'expanded_query': '', 'topic': {}, 'error': str(call)}
+            else:
+                try:
+                    analysis = interpret_result(call.get(timeout=timeout), messages)
+                except Exception as e:
+                    analysis = interpret_exception(e, messages)
+            record = {'line': line_number, **analysis}
+            output_file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            written += 1
+            if written % checkpoint_every == 0:
+                output_file.flush()
+                save_checkpoint(checkpoint_path, line_number + 1, output_file.tell())
+
+        for line_number, messages in read_conversations(input_file, skip=checkpoint['next_line']):
+            if isinstance(messages, Exception):
+                pending.append((line_number, [], messages))
+            else:
+                messages = apply_context_policy(messages, policy)
+                try:
+                    call = service.infer.spawn(messages=messages)
+                except Exception as e:
+                    call = e
+                pending.append((line_number, messages, call))
+            if len(pending) >= concurrency:
+                write_next()
+
+        while pending:
+            write_next()
+
+        output_file.flush()
+
+    # A completed run needs no checkpoint
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return written
+
+
+def tag_file_local(input_path: str, output_path: str, batch_size: int = 1024):
+    """Tag every conversation with the local fallback tagger, without calling Modal."""
+    checkpoint_path = f"{output_path}.checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    mode = 'r+b' if os.path.exists(output_path) else 'wb'
+    with open(input_path, 'r', encoding='utf-8') as input_file, open(output_path, mode) as output_file:
+        output_file.truncate(checkpoint['output_bytes'])
+        output_file.seek(checkpoint['output_bytes'])
+
+        written = 0
+        batch = []
+
+        def write_batch():
+            nonlocal written
+            analyses = get_fallback_analyses([[] if isinstance(m, Exception) else m for _, m in batch])
+            for (line_number, messages), analysis in zip(batch, analyses):
+                if isinstance(messages, Exception):
+                    analysis = {'expanded_query': '', 'topic': {}, 'error': str(messages)}
+                record = {'line': line_number, **analysis}
+                output_file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            written += len(batch)
+            output_file.flush()
+            save_checkpoint(checkpoint_path, batch[-1][0] + 1, output_file.tell())
+            batch.clear()
+
+        for line_number, messages in read_conversations(input_file, skip=checkpoint['next_line']):
+            batch.append((line_number, messages))
+            if len(batch) >= batch_size:
+                write_batch()
+        if batch:
+            write_batch()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tag a JSONL file of conversations with the Modal tagger.")
+    parser.add_argument('input', help="JSONL file with one {\"messages\": [...]} conversation per line")
+    parser.add_argument('output', help="JSONL file to write analyses to")
+    parser.add_argument('--concurrency', type=int, default=32, help="maximum Modal calls in flight")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="records between checkpoints")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds to wait for each result")
+    parser.add_argument('--context-turns', type=int, default=4, help="recent turns sent verbatim")
+    parser.add_argument('--context-tokens', type=int, default=1024, help="token budget per conversation")
+    parser.add_argument('--local', action='store_true',
+                        help="tag with the local keyword index and classifier instead of Modal")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        written = tag_file_local(args.input, args.output)
+        print(f"Tagged {written} conversations locally -> {args.output}", file=sys.stderr)
+        return
+
+    import modal
+
+    QueryExpansionService = modal.Cls.from_name(MODAL_APP_NAME, MODAL_CLASS_NAME)
+    policy = ContextPolicy(recent_turns=args.context_turns, max_tokens=args.context_tokens)
+    written = tag_file(
+        args.input,
+        args.output,
+        QueryExpansionService(),
+        policy,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        timeout=args.timeout
+    )
+    print(f"Tagged {written} conversations -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
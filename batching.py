@@ -0,0 +1,120 @@
+"""
+Micro-batching of tagger requests from all sessions into batched Modal calls.
+
+    batcher = MicroBatcher(lambda batch: infer_batch(service, batch), window=0.005, max_batch=16)
+    result = batcher.submit(messages).result()
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import REGISTRY as METRICS
+
+DEFAULT_BATCH_METHOD = 'infer_batch'
+
+
+def infer_batch(service, conversations: list, method_name: str = DEFAULT_BATCH_METHOD) -> list:
+    """
+    Run QueryExpansionService inference for several conversations at once.
+
+    Uses the service's batch method `method_name` when it has one, which takes
+    `conversations=[messages, ...]` and returns one result per conversation.
+    Otherwise every conversation is spawned at once and collected, so a batch
+    holds one waiting thread instead of one per request. A failed spawned
+    call is returned as its exception, in place of the result.
+    """
+    method = getattr(service, method_name, None) if method_name else None
+    if method is not None:
+        return list(method.remote(conversations=conversations))
+
+    calls = [service.infer.spawn(messages=messages) for messages in conversations]
+    results = []
+    for call in calls:
+        try:
+            results.append(call.get())
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `window` seconds after the first one
+    arrives, or until `max_batch` are waiting, then hands them to
+    `dispatch(items)` in a single call. `dispatch` returns one result per
+    item, in order; an exception instance in its place fails just that item,
+    and an exception raised by `dispatch` fails the whole batch.
+
+    Batches are dispatched on `executor` (or inline on the collector thread
+    without one), so the next batch is collected while the last is in flight.
+    """
+
+    def __init__(self, dispatch, window: float = 0.005, max_batch: int = 16, executor=None,
+                 name: str = 'tagger_batch'):
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+        self._dispatch = dispatch
+        self._executor = executor
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+                self._thread.start()
+            self._pending.append((item, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # The window starts with the oldest waiting request, bounding the latency added to it
+                deadline = self._pending[0][2] + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            if self._executor is None:
+                self._run_batch(batch)
+            else:
+                self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: list):
+        now = time.perf_counter()
+        for _, _, submitted in batch:
+            METRICS.observe(f'{self.name}_wait', now - submitted)
+        METRICS.inc(f'{self.name}_dispatches_total')
+        METRICS.inc(f'{self.name}_requests_total', len(batch))
+        try:
+            with METRICS.span(f'{self.name}_dispatch'):
+                results = self._dispatch([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"batch of {len(batch)} returned {len(results)} results")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,309 @@
+"""
+In-process stand-ins for modal.Cls and genai.Client with configurable
+latency and error injection, for benchmarks and load tests.
+
+    modal_cls = FakeModalCls(latency=0.2, jitter=0.05, error_rate=0.01)
+    handle = ModalServiceHandle(resolve=lambda: modal_cls.from_name(MODAL_APP_NAME, MODAL_CLASS_NAME)())
+    client = FakeGenaiClient(first_chunk_latency=0.3, chunks=20)
+"""
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from context_window import estimate_tokens
+from keyword_index import get_keyword_index
+
+
+class Latency:
+    """
+    Samples delays around `mean` seconds, never below zero.
+
+    'normal' adds gaussian jitter with standard deviation `jitter`;
+    'lognormal' gives the long right tail typical of network calls, with
+    `jitter` as the sigma of the underlying normal distribution.
+    """
+
+    def __init__(self, mean: float = 0.0, jitter: float = 0.0, seed: int = None, distribution: str = 'normal'):
+        self.mean = mean
+        self.jitter = jitter
+        self.distribution = distribution
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if not self.jitter:
+            return self.mean
+        with self._lock:
+            if self.distribution == 'lognormal':
+                # Scaled so the median delay is `mean`
+                return self.mean * self._random.lognormvariate(0.0, self.jitter)
+            return max(0.0, self._random.gauss(self.mean, self.jitter))
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def sleep_async(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def fake_labels(messages: list) -> dict:
+    """A plausible QueryExpansionService.infer result for `messages`."""
+    query = messages[-1]['content'] if messages else ''
+    topic = get_keyword_index().classify(query) or {'level_1': 'General', 'level_2': 'Chitchat'}
+    return {'labels': {'expanded_query': query, 'topic': topic}}
+
+
+class FakeFunctionCall:
+    def __init__(self, wait_for_result):
+        self._wait_for_result = wait_for_result
+
+    def get(self, timeout: float = None):
+        return self._wait_for_result()
+
+
+class FakeRemote:
+    """Callable like a Modal method's .remote, with the async variant as .remote.aio."""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __call__(self, **kwargs):
+        self._owner.calls += 1
+        self._owner.latency.sleep()
+        return self._result(kwargs)
+
+    async def aio(self, **kwargs):
+        self._owner.calls += 1
+        await self._owner.latency.sleep_async()
+        return self._result(kwargs)
+
+    def _result(self, kwargs):
+        owner = self._owner
+        if owner.error_rate and owner.random.random() < owner.error_rate:
+            raise ConnectionError(owner.error)
+        return owner.result_fn(kwargs.get('messages', []))
+
+
+class FakeMethod:
+    """Stands in for a Modal method, with .remote (and .remote.aio) and .spawn."""
+
+    def __init__(self, owner):
+        self.remote = FakeRemote(owner)
+
+    def spawn(self, **kwargs):
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = self.remote(**kwargs)
+            except Exception as e:
+                outcome['error'] = e
+            done.set()
+
+        threading.Thread(target=run, daemon=True).start()
+
+        def result():
+            done.wait()
+            if 'error' in outcome:
+                raise outcome['error']
+            return outcome['result']
+
+        return FakeFunctionCall(result)
+
+
+class FakeBatchMethod:
+    """Stands in for a batched Modal method: one latency sample per batch plus `per_item` seconds per conversation."""
+
+    def __init__(self, owner, per_item: float):
+        self._owner = owner
+        self._per_item = per_item
+
+    def remote(self, conversations: list):
+        owner = self._owner
+        owner.batch_calls += 1
+        owner.latency.sleep()
+        if self._per_item:
+            time.sleep(self._per_item * len(conversations))
+        if owner.error_rate and owner.random.random() < owner.error_rate:
+            raise ConnectionError(owner.error)
+        return [owner.result_fn(messages) for messages in conversations]
+
+
+class FakeModalCls:
+    """
+    Stands in for modal.Cls: from_name() returns the class, calling it returns
+    a service whose `infer` method sleeps for the configured latency, fails
+    with probability `error_rate`, and otherwise returns `result_fn(messages)`.
+    With `batch_method`, the service also has a batched method of that name.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error: str = "connection reset by peer", result_fn=fake_labels, seed: int = None,
+                 distribution: str = 'normal', batch_method: str = None, batch_item_latency: float = 0.0):
+        self.latency = Latency(latency, jitter, seed, distribution)
+        self.error_rate = error_rate
+        self.error = error
+        self.result_fn = result_fn
+        self.random = random.Random(seed)
+        self.batch_method = batch_method
+        self.batch_item_latency = batch_item_latency
+        self.calls = 0
+        self.batch_calls = 0
+
+    def from_name(self, app_name: str, class_name: str):
+        return self
+
+    def hydrate(self):
+        return self
+
+    def __call__(self):
+        service = type('FakeQueryExpansionService', (), {})()
+        service.infer = FakeMethod(self)
+        if self.batch_method:
+            setattr(service, self.batch_method, FakeBatchMethod(self, self.batch_item_latency))
+        return service
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _reply_words(self, contents) -> list:
+        last = contents[-1]['parts'][0]['text'] if contents else ''
+        return (f"Here is a reply about {last}. " * 4).split()
+
+    def _maybe_fail(self):
+        client = self._client
+        if client.error_rate and client.random.random() < client.error_rate:
+            raise RuntimeError("503 UNAVAILABLE")
+
+    def _input_delay(self, contents, config) -> float:
+        """Prefill time for the input tokens not covered by a cached_content handle."""
+        client = self._client
+        config = config or {}
+        name = config.get('cached_content')
+        if name is not None and name not in client.caches.store:
+            raise RuntimeError(f"404 NOT_FOUND: cached content {name} not found")
+        tokens = sum(estimate_tokens(part['text']) for content in contents for part in content['parts'])
+        tokens += estimate_tokens(config.get('system_instruction') or '')
+        client.input_tokens += tokens
+        return client.input_token_latency * tokens
+
+    def generate_content(self, model: str, contents, config=None):
+        client = self._client
+        client.calls += 1
+        time.sleep(self._input_delay(contents, config))
+        client.first_chunk_latency.sleep()
+        self._maybe_fail()
+        for _ in range(client.chunks - 1):
+            client.chunk_latency.sleep()
+        return FakeChunk(" ".join(self._reply_words(contents)))
+
+    def generate_content_stream(self, model: str, contents, config=None):
+        client = self._client
+        client.calls += 1
+        words = self._reply_words(contents)
+        per_chunk = max(1, len(words) // client.chunks)
+        time.sleep(self._input_delay(contents, config))
+        client.first_chunk_latency.sleep()
+        self._maybe_fail()
+        for i in range(0, len(words), per_chunk):
+            if i:
+                client.chunk_latency.sleep()
+            yield FakeChunk(" ".join(words[i:i + per_chunk]) + " ")
+
+
+class FakeAsyncModels(FakeModels):
+    """The `client.aio.models` counterpart of FakeModels."""
+
+    async def generate_content(self, model: str, contents, config=None):
+        client = self._client
+        client.calls += 1
+        await asyncio.sleep(self._input_delay(contents, config))
+        await client.first_chunk_latency.sleep_async()
+        self._maybe_fail()
+        for _ in range(client.chunks - 1):
+            await client.chunk_latency.sleep_async()
+        return FakeChunk(" ".join(self._reply_words(contents)))
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        client = self._client
+        client.calls += 1
+        words = self._reply_words(contents)
+        per_chunk = max(1, len(words) // client.chunks)
+        await asyncio.sleep(self._input_delay(contents, config))
+        await client.first_chunk_latency.sleep_async()
+        self._maybe_fail()
+
+        async def stream():
+            for i in range(0, len(words), per_chunk):
+                if i:
+                    await client.chunk_latency.sleep_async()
+                yield FakeChunk(" ".join(words[i:i + per_chunk]) + " ")
+        return stream()
+
+
+class FakeCaches:
+    """Stands in for `client.caches`: create, update and delete cached contents, with Gemini's size minimum."""
+
+    def __init__(self, client, min_tokens: int = 0):
+        self._client = client
+        self.min_tokens = min_tokens
+        self.store = {}
+        self.created = 0
+
+    def create(self, model: str, config: dict):
+        contents = config.get('contents', [])
+        tokens = sum(estimate_tokens(part['text']) for content in contents for part in content['parts'])
+        tokens += estimate_tokens(config.get('system_instruction') or '')
+        if tokens < self.min_tokens:
+            raise RuntimeError(f"400 INVALID_ARGUMENT: cached content is too small, minimum is {self.min_tokens} tokens")
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        self.store[name] = tokens
+        return SimpleNamespace(name=name, model=model)
+
+    def update(self, name: str, config: dict):
+        if name not in self.store:
+            raise RuntimeError(f"404 NOT_FOUND: cached content {name} not found")
+        return SimpleNamespace(name=name)
+
+    def delete(self, name: str):
+        self.store.pop(name, None)
+
+
+class FakeGenaiClient:
+    """
+    Stands in for genai.Client: `models.generate_content` and
+    `models.generate_content_stream`, their async variants under `aio.models`,
+    and `caches`. Each request waits `input_token_latency` per input token
+    not covered by a cached_content handle before its first chunk.
+    """
+
+    def __init__(self, first_chunk_latency: float = 0.0, chunk_latency: float = 0.0, jitter: float = 0.0,
+                 chunks: int = 10, error_rate: float = 0.0, seed: int = None, distribution: str = 'normal',
+                 input_token_latency: float = 0.0, min_cache_tokens: int = 0, **kwargs):
+        # **kwargs absorbs genai.Client arguments (api_key, http_options, ...) when patched in
+        self.first_chunk_latency = Latency(first_chunk_latency, jitter, seed, distribution)
+        self.chunk_latency = Latency(chunk_latency, 0.0, seed)
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.input_token_latency = input_token_latency
+        self.calls = 0
+        self.input_tokens = 0
+        self.caches = FakeCaches(self, min_cache_tokens)
+        self.models = FakeModels(self)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(self))
@@ -0,0 +1,256 @@
+"""
+Multi-session load test for one Streamlit server process.
+
+Drives N concurrent simulated sessions of app.py with
+streamlit.testing.v1.AppTest, each replaying the user turns of the
+conversations in templete.jsonl. Modal and Gemini are replaced by the
+in-process fakes in benchmarks/fakes.py with lognormal latencies.
+For each concurrency level the report gives turns/sec, per-turn latency
+percentiles, peak RSS and memory per session.
+
+Secrets come from a secrets.toml in a temporary working directory, since
+AppTest swaps the global st.secrets on every run when given its own and
+concurrent sessions would race on that. Sessions are built and given their
+first run one at a time; only the user turns run concurrently.
+
+    python benchmarks/load_test.py --sessions 1 4 16 --modal-latency 0.4 --gemini-latency 0.6
+    python benchmarks/load_test.py --sessions 8 --output load.json
+"""
+import argparse
+import gc
+import json
+import os
+import pickle
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from streamlit import config as st_config  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from async_backend import AsyncBackend  # noqa: E402
+from batching import MicroBatcher  # noqa: E402
+from benchmarks.fakes import FakeGenaiClient, FakeModalCls  # noqa: E402
+from modal_service import ModalServiceHandle  # noqa: E402
+from templates import read_templates  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, 'app.py')
+TEMPLATE_PATH = os.path.join(ROOT, 'templete.jsonl')
+
+SECRETS = {
+    'token_id': 'load-test',
+    'token_secret': 'load-test',
+    'GOOGLE_API_KEY': 'load-test',
+}
+# Worker pools the app caches with st.cache_resource
+APP_EXECUTOR_PREFIXES = ('remote', 'turn', 'gemini-cache')
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, from /proc where available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def write_secrets(directory: str) -> str:
+    """Write SECRETS to <directory>/.streamlit/secrets.toml and return its path."""
+    path = os.path.join(directory, '.streamlit', 'secrets.toml')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for key, value in SECRETS.items():
+            f.write(f"{key} = {json.dumps(value)}\n")
+    return path
+
+
+def start_session(timeout: float):
+    """Build one session and give it its first run: (AppTest, None), or (None, error) if it did not start."""
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.run()
+    except Exception as e:
+        return None, f"initial run failed: {e!r}"
+    if at.exception:
+        return None, f"initial run raised: {at.exception[0].value}"
+    if not at.chat_input:
+        return None, "initial run rendered no chat input"
+    return at, None
+
+
+def run_session(at, conversations: list, turns: int) -> dict:
+    """One simulated user: replay user turns until `turns` have been sent."""
+    latencies = []
+    errors = 0
+    sent = 0
+    while sent < turns:
+        for conversation in conversations:
+            for message in conversation:
+                if message['role'] != 'user' or sent >= turns:
+                    continue
+                if not at.chat_input:
+                    # The last run failed before rendering the input - the session cannot continue
+                    return session_result(at, latencies, errors + 1)
+                start = time.perf_counter()
+                try:
+                    at.chat_input[0].set_value(message['content']).run()
+                except Exception:
+                    errors += 1
+                else:
+                    errors += len(at.exception)
+                latencies.append(time.perf_counter() - start)
+                sent += 1
+    return session_result(at, latencies, errors)
+
+
+def session_result(at, latencies: list, errors: int) -> dict:
+    # Only the in-memory part of the conversation counts against server RAM
+    messages = at.session_state['messages'].recent() if 'messages' in at.session_state else []
+    return {
+        'latencies': latencies,
+        'errors': errors,
+        'session_bytes': len(pickle.dumps(messages)),
+    }
+
+
+def release_shared_resources():
+    """
+    Stop the background threads of the app's cached objects, then clear the caches.
+
+    st.cache_resource.clear() only drops the references, so without this the
+    health checks, event loops and worker pools of every earlier level would
+    keep running and skew the thread and RSS numbers of the next.
+    """
+    for thread in threading.enumerate():
+        if thread.name == 'warmup':
+            thread.join()
+    stopped = []
+    for obj in gc.get_objects():
+        if isinstance(obj, ModalServiceHandle):
+            obj.stop()
+            stopped.append(obj._health_thread)
+        elif isinstance(obj, (AsyncBackend, MicroBatcher)):
+            obj.stop()
+            stopped.append(obj._thread)
+        elif isinstance(obj, ThreadPoolExecutor) and obj._thread_name_prefix.startswith(APP_EXECUTOR_PREFIXES):
+            obj.shutdown(wait=False, cancel_futures=True)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    for thread in stopped:
+        if thread is not None:
+            thread.join(timeout=5)
+
+
+def run_level(sessions: int, conversations: list, args) -> dict:
+    # Start each level from cold shared resources, like a fresh server
+    release_shared_resources()
+
+    rss_before = current_rss_bytes()
+    started, failed = [], 0
+    for _ in range(sessions):
+        at, error = start_session(args.timeout)
+        if at is None:
+            print(f"session error: {error}", file=sys.stderr)
+            failed += 1
+        else:
+            started.append(at)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, len(started))) as pool:
+        results = list(pool.map(lambda at: run_session(at, conversations, args.turns), started))
+    elapsed = time.perf_counter() - start
+    rss_after = current_rss_bytes()
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    return {
+        'sessions': sessions,
+        'failed_sessions': failed,
+        'turns': len(latencies),
+        'errors': failed + sum(result['errors'] for result in results),
+        'elapsed_s': elapsed,
+        'turns_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_s': {
+            'mean': statistics.mean(latencies) if latencies else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+        },
+        'peak_rss_bytes': peak_rss_bytes(),
+        'rss_growth_per_session_bytes': max(0, rss_after - rss_before) // sessions,
+        'session_state_bytes': statistics.mean(r['session_bytes'] for r in results) if results else 0,
+        'threads': threading.active_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="concurrency levels to run")
+    parser.add_argument('--turns', type=int, default=10, help="user turns per session")
+    parser.add_argument('--modal-latency', type=float, default=0.3, help="median fake Modal latency (s)")
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help="median fake Gemini first-chunk latency (s)")
+    parser.add_argument('--chunk-latency', type=float, default=0.02, help="fake Gemini delay between chunks (s)")
+    parser.add_argument('--jitter', type=float, default=0.5, help="lognormal sigma for both fakes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fake Modal error rate")
+    parser.add_argument('--timeout', type=float, default=60.0, help="per-run AppTest timeout (s)")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    conversations = [t['messages'] for t in read_templates(TEMPLATE_PATH)]
+    modal_cls = FakeModalCls(latency=args.modal_latency, jitter=args.jitter, error_rate=args.error_rate,
+                             distribution='lognormal')
+    gemini = FakeGenaiClient(first_chunk_latency=args.gemini_latency, chunk_latency=args.chunk_latency,
+                             jitter=args.jitter, chunks=20, distribution='lognormal')
+
+    report = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, mock.patch('modal.Cls.from_name', modal_cls.from_name), \
+            mock.patch('google.genai.Client', lambda **kwargs: gemini):
+        os.chdir(workdir)
+        # The default secrets locations were resolved from the working directory when streamlit was imported
+        st_config.set_option('secrets.files', [write_secrets(workdir)])
+        try:
+            print(f"{'sessions':>8} {'turns/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} "
+                  f"{'peak RSS':>10} {'RSS/sess':>10} {'state/sess':>10} {'errors':>7}")
+            for sessions in args.sessions:
+                level = run_level(sessions, conversations, args)
+                report.append(level)
+                latency = level['latency_s']
+                print(f"{sessions:>8} {level['turns_per_s']:>9.2f} {latency['p50']:>7.2f}s {latency['p95']:>7.2f}s "
+                      f"{latency['p99']:>7.2f}s {level['peak_rss_bytes'] / 2**20:>8.0f}MB "
+                      f"{level['rss_growth_per_session_bytes'] / 2**10:>8.0f}KB "
+                      f"{level['session_state_bytes'] / 2**10:>8.1f}KB {level['errors']:>7}")
+        finally:
+            release_shared_resources()
+            os.chdir(cwd)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'levels': report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+Benchmarks for the app's hot paths, run against in-process fake backends.
+
+    python benchmarks/run_benchmarks.py                        # writes benchmarks/results/<commit>.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<baseline>.json
+    python benchmarks/run_benchmarks.py --only fallback --modal-latency 0.05
+
+Each benchmark reports the median and best time per operation over several
+rounds. With --compare, benchmarks slower than the baseline by more than
+--threshold are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analysis_cache import AnalysisCache  # noqa: E402
+from async_backend import AsyncBackend  # noqa: E402
+from benchmarks.fakes import FakeGenaiClient, FakeModalCls  # noqa: E402
+from chat import build_gemini_contents, stream_reply  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from context_cache import PrefixCache  # noqa: E402
+from context_window import ContextPolicy  # noqa: E402
+from modal_service import ModalServiceHandle  # noqa: E402
+from pipeline import AnalysisPipeline  # noqa: E402
+from rendering import build_user_message_html  # noqa: E402
+from settings import CONTEXT_DEFAULTS  # noqa: E402
+from tagging import MODAL_APP_NAME, MODAL_CLASS_NAME, get_fallback_analysis  # noqa: E402
+from templates import TemplateLibrary, read_templates  # noqa: E402
+
+TEMPLATE_PATH = os.path.join(ROOT, 'templete.jsonl')
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark. The function takes the CLI args and returns (run, ops_per_run)."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def sample_conversations() -> list:
+    return [t['messages'] for t in read_templates(TEMPLATE_PATH)]
+
+
+def long_conversation(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f"Question {i} about the stock market and inflation?",
+                         'analysis': {'expanded_query': f"Question {i}", 'topic': {}}})
+        messages.append({'role': 'assistant', 'content': "An answer that runs for a sentence or two. " * 4})
+    return messages
+
+
+@benchmark('fallback_analysis')
+def bench_fallback(args):
+    queries = [m[-1:] for m in sample_conversations()]
+    queries += [[{'role': 'user', 'content': text}] for text in (
+        "how do I fix npm install errors", "she said hello", "who won the IPL final",
+        "what is the weather like tomorrow", "best sci-fi movies of the decade",
+    )]
+    batch = queries * 200
+
+    def run():
+        for messages in batch:
+            get_fallback_analysis(messages)
+    return run, len(batch)
+
+
+@benchmark('load_templates')
+def bench_load_templates(args):
+    path = synthetic_template_file(args.templates)
+
+    def run():
+        read_templates(path)
+    return run, args.templates
+
+
+def synthetic_template_file(count: int) -> str:
+    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    tmp = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8')
+    for i in range(count):
+        tmp.write(lines[i % len(lines)])
+    tmp.close()
+    return tmp.name
+
+
+@benchmark('template_index_build')
+def bench_template_index_build(args):
+    path = synthetic_template_file(args.templates)
+
+    def run():
+        TemplateLibrary(path).close()
+    return run, args.templates
+
+
+@benchmark('template_index_open')
+def bench_template_index_open(args):
+    path = synthetic_template_file(args.templates)
+    index_path = f"{path}.idx"
+    TemplateLibrary(path, index_path=index_path).close()
+
+    def run():
+        for _ in range(10):
+            TemplateLibrary(path, index_path=index_path).close()
+    return run, 10
+
+
+@benchmark('template_page')
+def bench_template_page(args):
+    library = TemplateLibrary(synthetic_template_file(args.templates))
+    queries = ['', 'arctic', 'climate chan', 'the', 'quantum computing']
+
+    def run():
+        # One sidebar render: search, then parse-free titles for a page, then load one template
+        for query in queries:
+            matches = library.search(query)
+            [library.titles[i] for i in matches[:10]]
+            if matches:
+                library._parse(matches[0])
+    return run, len(queries)
+
+
+@benchmark('gemini_contents')
+def bench_gemini_contents(args):
+    messages = long_conversation(50)
+    policy = ContextPolicy(recent_turns=12, max_tokens=8000)
+
+    def run():
+        for _ in range(100):
+            build_gemini_contents(messages, policy)
+    return run, 100
+
+
+@benchmark('message_html')
+def bench_message_html(args):
+    messages = []
+    for messages_ in sample_conversations():
+        for m in messages_:
+            if m['role'] == 'user':
+                messages.append((m['content'], {'expanded_query': m['content'] + " <expanded>",
+                                                'topic': {'level_1': 'Science', 'level_2': 'Climate'}}))
+    batch = messages * 200
+
+    def run():
+        for content, analysis in batch:
+            build_user_message_html(content, analysis)
+    return run, len(batch)
+
+
+def make_pipeline(args, error_rate: float = 0.0, batch_window: float = None) -> AnalysisPipeline:
+    modal_cls = FakeModalCls(latency=args.modal_latency, jitter=args.modal_jitter, error_rate=error_rate, seed=7,
+                             batch_method='infer_batch')
+    handle = ModalServiceHandle(
+        CircuitBreaker(),
+        resolve=lambda: modal_cls.from_name(MODAL_APP_NAME, MODAL_CLASS_NAME)()
+    )
+    return AnalysisPipeline(
+        handle=handle,
+        cache=AnalysisCache(max_entries=100000),
+        policy=ContextPolicy(recent_turns=4, max_tokens=1024),
+        executor=ThreadPoolExecutor(max_workers=8),
+        batch_window=batch_window
+    )
+
+
+def concurrent_new_conversations(pipeline: AnalysisPipeline, sessions: int = 16):
+    """A run that has `sessions` sessions each send a different new conversation at once."""
+    conversations = sample_conversations()
+    pool = ThreadPoolExecutor(max_workers=sessions)
+    counter = [0]
+
+    def run():
+        counter[0] += 1
+        batch = [conversations[i % len(conversations)] + [{'role': 'user', 'content': f"follow-up {counter[0]}.{i}"}]
+                 for i in range(sessions)]
+        list(pool.map(pipeline.analyze, batch))
+    return run, sessions
+
+
+@benchmark('query_analysis_concurrent')
+def bench_query_analysis_concurrent(args):
+    return concurrent_new_conversations(make_pipeline(args))
+
+
+@benchmark('query_analysis_async')
+def bench_query_analysis_async(args):
+    pipeline = make_pipeline(args)
+    backend = AsyncBackend()
+    conversations = sample_conversations()
+    counter = [0]
+
+    def run():
+        # 64 different new conversations in flight at once on the shared loop
+        counter[0] += 1
+        futures = [
+            backend.submit(pipeline.analyze_async(
+                conversations[i % len(conversations)] + [{'role': 'user', 'content': f"follow-up {counter[0]}.{i}"}]
+            ))
+            for i in range(64)
+        ]
+        for future in futures:
+            future.result()
+    return run, 64
+
+
+@benchmark('query_analysis_batched')
+def bench_query_analysis_batched(args):
+    return concurrent_new_conversations(make_pipeline(args, batch_window=args.batch_window))
+
+
+@benchmark('query_analysis_cold')
+def bench_query_analysis_cold(args):
+    pipeline = make_pipeline(args)
+    conversations = sample_conversations()
+    counter = [0]
+
+    def run():
+        # Unique conversations, so every call misses the cache
+        for messages in conversations:
+            counter[0] += 1
+            pipeline.analyze(messages + [{'role': 'user', 'content': f"follow-up {counter[0]}"}])
+    return run, len(conversations)
+
+
+@benchmark('query_analysis_cached')
+def bench_query_analysis_cached(args):
+    pipeline = make_pipeline(args)
+    conversations = sample_conversations()
+    for messages in conversations:
+        pipeline.analyze(messages)
+
+    def run():
+        for _ in range(20):
+            for messages in conversations:
+                pipeline.analyze(messages)
+    return run, 20 * len(conversations)
+
+
+@benchmark('query_analysis_coalesced')
+def bench_query_analysis_coalesced(args):
+    pipeline = make_pipeline(args)
+    conversations = sample_conversations()
+    sessions = ThreadPoolExecutor(max_workers=16)
+    counter = [0]
+
+    def run():
+        # 16 sessions send the same new conversation at once
+        for messages in conversations:
+            counter[0] += 1
+            messages = messages + [{'role': 'user', 'content': f"follow-up {counter[0]}"}]
+            list(sessions.map(lambda _: pipeline.analyze(messages), range(16)))
+    return run, 16 * len(conversations)
+
+
+@benchmark('query_analysis_errors')
+def bench_query_analysis_errors(args):
+    pipeline = make_pipeline(args, error_rate=args.modal_error_rate)
+    conversations = sample_conversations()
+    counter = [0]
+
+    def run():
+        for messages in conversations:
+            counter[0] += 1
+            pipeline.analyze(messages + [{'role': 'user', 'content': f"follow-up {counter[0]}"}])
+    return run, len(conversations)
+
+
+@benchmark('gemini_stream')
+def bench_gemini_stream(args):
+    client = FakeGenaiClient(first_chunk_latency=args.gemini_latency, chunks=20)
+    messages = long_conversation(10)
+    policy = ContextPolicy(recent_turns=12, max_tokens=8000)
+
+    def run():
+        for _ in range(10):
+            for _ in stream_reply(client, messages, policy):
+                pass
+    return run, 10
+
+
+def long_conversation_turns(args, cached: bool):
+    """
+    A 30-turn conversation under the shipped CHAT policy, where the fake
+    model pays per uncached input token. The token budget starts trimming
+    the window about a third of the way in.
+    """
+    client = FakeGenaiClient(chunks=5, input_token_latency=args.input_token_latency, min_cache_tokens=1024)
+    policy = CONTEXT_DEFAULTS['CHAT']
+    turns = [f"Question {i}: " + "tell me more about the history of the stock market and inflation. " * 12
+             for i in range(30)]
+
+    def run():
+        # A fresh cache each run, so no prefix is warm from an earlier round
+        prefix_cache = PrefixCache(client, min_new_tokens=512) if cached else None
+        messages = []
+        for turn in turns:
+            messages.append({'role': 'user', 'content': turn})
+            reply = "".join(stream_reply(client, messages, policy, prefix_cache=prefix_cache))
+            messages.append({'role': 'assistant', 'content': reply})
+    return run, len(turns)
+
+
+@benchmark('gemini_long_conversation')
+def bench_gemini_long_conversation(args):
+    return long_conversation_turns(args, cached=False)
+
+
+@benchmark('gemini_long_conversation_cached')
+def bench_gemini_long_conversation_cached(args):
+    return long_conversation_turns(args, cached=True)
+
+
+def run_benchmark(setup, args) -> dict:
+    run, ops = setup(args)
+    run()  # warm-up
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) / ops)
+    median = statistics.median(timings)
+    return {
+        'median_s': median,
+        'min_s': min(timings),
+        'ops_per_s': 1 / median if median else float('inf'),
+        'rounds': args.rounds,
+        'ops_per_round': ops,
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> list:
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\n{'benchmark':<24} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_s'], result['median_s']
+        change = (after - before) / before if before else 0.0
+        print(f"{name:<24} {before * 1e6:>10.1f}us {after * 1e6:>10.1f}us {change:>+7.0%}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', help="benchmark names (or prefixes) to run")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--templates', type=int, default=20000, help="lines in the synthetic template file")
+    parser.add_argument('--modal-latency', type=float, default=0.0, help="fake Modal latency in seconds")
+    parser.add_argument('--modal-jitter', type=float, default=0.0)
+    parser.add_argument('--modal-error-rate', type=float, default=0.2)
+    parser.add_argument('--batch-window', type=float, default=0.005, help="tagger micro-batch window (s)")
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help="fake Gemini time to first chunk")
+    parser.add_argument('--input-token-latency', type=float, default=2e-6,
+                        help="fake Gemini prefill time per uncached input token (s)")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        results[name] = result = run_benchmark(setup, args)
+        print(f"{name:<24} {result['median_s'] * 1e6:>10.1f}us/op  {result['ops_per_s']:>12.0f} ops/s")
+
+    commit = current_commit()
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'only')},
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\nRegressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Gemini chat calls, independent of the Streamlit layer."""
+import time
+
+from context_window import ContextPolicy, apply_context_policy
+from metrics import REGISTRY as METRICS
+
+# System instruction
+SYSTEM_INSTRUCTION = """You are a helpful AI assistant. Engage in natural conversation with the user.
+Keep your responses concise but informative. Be friendly and helpful."""
+
+GEMINI_MODEL = 'gemini-2.5-flash'
+GEMINI_CONFIG = {
+    'system_instruction': SYSTEM_INSTRUCTION,
+    'temperature': 0.7,
+    'top_p': 0.95,
+    'top_k': 40,
+    'max_output_tokens': 1024,
+}
+
+
+def build_gemini_contents(messages: list, policy: ContextPolicy) -> list:
+    """Map the windowed chat history to Gemini contents."""
+    return [
+        {'role': 'user' if m['role'] == 'user' else 'model', 'parts': [{'text': m['content']}]}
+        for m in apply_context_policy(messages, policy)
+    ]
+
+
+def request_attempts(messages: list, policy: ContextPolicy, config: dict, prefix_cache=None) -> list:
+    """
+    (contents, config) pairs to try in order: the request using a cached
+    prefix where `prefix_cache` has one, then the plain request as fallback.
+    """
+    contents = build_gemini_contents(messages, policy)
+    if prefix_cache is not None:
+        # A window trimmed one turn at a time opens differently every turn - a new cache would never be hit
+        stable = policy.trim_turns > 1 or len(contents) == len(messages)
+        cached_contents, cached_config = prefix_cache.prepare(contents, config, create=stable)
+        if cached_config is not config:
+            return [(cached_contents, cached_config), (contents, config)]
+    return [(contents, config)]
+
+
+def rejects_cached_content(e: Exception) -> bool:
+    """Whether the API refused the request's cached_content handle, as opposed to failing under load."""
+    code, status = getattr(e, 'code', None), getattr(e, 'status', None)
+    message = str(e)
+    if code in (400, 404) or status in ('INVALID_ARGUMENT', 'NOT_FOUND'):
+        return True
+    if code == 403 or status == 'PERMISSION_DENIED':
+        return 'cache' in message.lower()
+    # Clients without structured errors put the status in the message
+    return 'NOT_FOUND' in message or 'INVALID_ARGUMENT' in message
+
+
+def _fall_back(prefix_cache, config: dict):
+    # The cached prefix was rejected (expired or deleted) - drop it and resend in full
+    prefix_cache.invalidate(config['cached_content'])
+    METRICS.inc('gemini_prefix_cache_fallbacks_total')
+
+
+def stream_reply(client, messages: list, policy: ContextPolicy, config: dict = None, prefix_cache=None):
+    """
+    Yield the Gemini reply as text chunks while it is being generated.
+
+    `config` replaces GEMINI_CONFIG; with a `prefix_cache`, the stable start
+    of the conversation is sent as a cached-content handle.
+    """
+    start = time.perf_counter()
+    attempts = request_attempts(messages, policy, config or GEMINI_CONFIG, prefix_cache)
+    for attempt, (contents, request_config) in enumerate(attempts, 1):
+        first_chunk = True
+        try:
+            stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config=request_config
+            )
+            for chunk in stream:
+                if first_chunk:
+                    METRICS.observe('gemini_first_chunk', time.perf_counter() - start)
+                    first_chunk = False
+                if chunk.text:
+                    yield chunk.text
+            break
+        except Exception as e:
+            # Once text has been shown, retrying would repeat it
+            if attempt == len(attempts) or not first_chunk or not rejects_cached_content(e):
+                raise
+            _fall_back(prefix_cache, request_config)
+    METRICS.observe('gemini_generate', time.perf_counter() - start)
+
+
+async def stream_reply_async(client, messages: list, policy: ContextPolicy, config: dict = None,
+                             prefix_cache=None):
+    """`stream_reply` through the client's async API (`client.aio`), as an async generator."""
+    start = time.perf_counter()
+    attempts = request_attempts(messages, policy, config or GEMINI_CONFIG, prefix_cache)
+    for attempt, (contents, request_config) in enumerate(attempts, 1):
+        first_chunk = True
+        try:
+            stream = await client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config=request_config
+            )
+            async for chunk in stream:
+                if first_chunk:
+                    METRICS.observe('gemini_first_chunk', time.perf_counter() - start)
+                    first_chunk = False
+                if chunk.text:
+                    yield chunk.text
+            break
+        except Exception as e:
+            if attempt == len(attempts) or not first_chunk or not rejects_cached_content(e):
+                raise
+            _fall_back(prefix_cache, request_config)
+    METRICS.observe('gemini_generate', time.perf_counter() - start)
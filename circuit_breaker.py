@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for a remote dependency.
+
+    While CLOSED, calls go through and their outcomes are kept in a sliding
+    window. Once at least `min_calls` outcomes are recorded and the failure
+    rate reaches `failure_threshold`, the breaker OPENs and calls fail fast.
+    After the open interval a single probe is let through (HALF_OPEN): success
+    closes the breaker, failure re-opens it with the interval doubled, up to
+    `max_open_seconds`.
+    """
+
+    def __init__(self, failure_threshold: float = 0.5, window_size: int = 20, min_calls: int = 4,
+                 open_seconds: float = 5.0, max_open_seconds: float = 300.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self._clock = clock
+        self._outcomes = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_count = 0
+        self._retry_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() >= self._retry_at:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go through now. In HALF_OPEN only one probe is allowed at a time."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back the HALF_OPEN probe slot of an allowed call that ended without an outcome, e.g. cancelled."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self._current_state() == HALF_OPEN:
+                self._close()
+            else:
+                self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._open()
+            elif state == CLOSED:
+                self._outcomes.append(False)
+                failures = self._outcomes.count(False)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_threshold:
+                    self._open()
+
+    def trip(self):
+        """Open the breaker immediately, e.g. when the service cannot even be resolved."""
+        with self._lock:
+            if self._current_state() != OPEN:
+                self._open()
+
+    def _open(self):
+        interval = min(self.open_seconds * (2 ** self._opened_count), self.max_open_seconds)
+        self._opened_count += 1
+        self._state = OPEN
+        self._retry_at = self._clock() + interval
+        self._probe_in_flight = False
+        self._outcomes.clear()
+
+    def _close(self):
+        self._state = CLOSED
+        self._opened_count = 0
+        self._probe_in_flight = False
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            failures = self._outcomes.count(False)
+            return {
+                'state': state,
+                'failure_rate': failures / len(self._outcomes) if self._outcomes else 0.0,
+                'retry_in': max(0.0, self._retry_at - self._clock()) if state == OPEN else 0.0,
+                'consecutive_opens': self._opened_count,
+            }
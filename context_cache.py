@@ -0,0 +1,192 @@
+"""
+Gemini context caching for the system instruction and the stable start of a conversation.
+
+    prefix_cache = PrefixCache(client)
+    contents, config = prefix_cache.prepare(contents, GEMINI_CONFIG)
+    client.models.generate_content(model=GEMINI_MODEL, contents=contents, config=config)
+
+`prepare` never calls the API itself: it swaps the longest cached prefix of
+`contents` for a `cached_content` handle, and creates caches for new
+prefixes in the background, so the first turns that could use one are
+not slowed down by creating it.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from chat import GEMINI_MODEL
+from context_window import estimate_tokens
+from metrics import REGISTRY as METRICS
+
+# Request settings that live in the cached content and may not be repeated next to it
+CACHED_CONFIG_KEYS = ('system_instruction', 'tools', 'tool_config')
+
+
+def content_tokens(contents: list) -> int:
+    return sum(estimate_tokens(part.get('text', '')) for content in contents for part in content['parts'])
+
+
+def prefix_keys(model: str, config: dict, contents: list) -> list:
+    """keys[i] identifies the model, system instruction and contents[:i + 1]."""
+    digest = hashlib.sha256(json.dumps([model, config.get('system_instruction')]).encode('utf-8'))
+    keys = []
+    for content in contents:
+        digest.update(json.dumps(content, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+class CachedPrefix:
+    __slots__ = ('name', 'expires_at')
+
+    def __init__(self, name: str, expires_at: float):
+        self.name = name
+        self.expires_at = expires_at
+
+
+class PrefixCache:
+    """
+    Cached-content handles for conversation prefixes, shared by all sessions.
+
+    Everything but the newest message of a request is a candidate prefix.
+    A cache is created once that prefix reaches `min_tokens` (Gemini's
+    minimum for explicit caching) and, if a shorter prefix is already
+    cached, once `min_new_tokens` have been added since. Handles live for
+    `ttl_seconds`; one that is used within `refresh_seconds` of expiring
+    has its TTL extended, and an unused one simply expires. Identical
+    prefixes from different sessions - conversations started from the same
+    template - share one cache.
+
+    Caching is optional: if the client has no caches API, or creating a
+    cache fails other than by being too small, caching is switched off
+    for `disable_seconds` and requests go out in full.
+    """
+
+    def __init__(self, client, model: str = GEMINI_MODEL, ttl_seconds: float = 600, min_tokens: int = 1024,
+                 min_new_tokens: int = 1024, refresh_seconds: float = 60, max_entries: int = 256,
+                 disable_seconds: float = 60, executor=None, clock=time.time):
+        self.client = client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.min_new_tokens = min_new_tokens
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self.disable_seconds = disable_seconds
+        self._executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini-cache")
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._pending = set()
+        self._too_small = set()
+        self._disabled_until = 0.0 if getattr(client, 'caches', None) is not None else float('inf')
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self._clock() >= self._disabled_until
+
+    def prepare(self, contents: list, config: dict, create: bool = True):
+        """
+        (contents, config) for the request: the longest cached prefix replaced
+        by its handle where possible. With `create=False`, existing caches
+        are used but no new one is started.
+        """
+        if len(contents) < 2 or not self.available:
+            return contents, config
+
+        keys = prefix_keys(self.model, config, contents)
+        now = self._clock()
+        cached_length, entry = 0, None
+        with self._lock:
+            for length in range(len(contents) - 1, 0, -1):
+                candidate = self._entries.get(keys[length - 1])
+                if candidate is not None and candidate.expires_at - now > 1.0:
+                    cached_length, entry = length, candidate
+                    self._entries.move_to_end(keys[length - 1])
+                    break
+
+        stable = contents[:-1]
+        new_tokens = content_tokens(stable[cached_length:])
+        stable_tokens = content_tokens(stable) + estimate_tokens(config.get('system_instruction') or '')
+        if create and stable_tokens >= self.min_tokens and (entry is None or new_tokens >= self.min_new_tokens):
+            self._schedule_create(keys[len(stable) - 1], stable, config)
+
+        if entry is None:
+            METRICS.inc('gemini_prefix_cache_misses_total')
+            return contents, config
+        METRICS.inc('gemini_prefix_cache_hits_total')
+        if entry.expires_at - now < self.refresh_seconds:
+            self._schedule_refresh(entry)
+        cached_config = {k: v for k, v in config.items() if k not in CACHED_CONFIG_KEYS}
+        cached_config['cached_content'] = entry.name
+        return contents[cached_length:], cached_config
+
+    def invalidate(self, name: str):
+        """Forget a handle the API rejected (for example because it expired early)."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.name == name]:
+                del self._entries[key]
+
+    def _schedule_create(self, key: str, prefix: list, config: dict):
+        with self._lock:
+            if key in self._entries or key in self._pending or key in self._too_small:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._create, key, prefix, config)
+
+    def _create(self, key: str, prefix: list, config: dict):
+        try:
+            with METRICS.span('gemini_prefix_cache_create'):
+                cached = self.client.caches.create(model=self.model, config={
+                    'contents': prefix,
+                    'system_instruction': config.get('system_instruction'),
+                    'ttl': f"{int(self.ttl_seconds)}s",
+                })
+        except Exception as e:
+            METRICS.inc('gemini_prefix_cache_errors_total')
+            with self._lock:
+                self._pending.discard(key)
+                if 'too small' in str(e).lower() or 'minimum' in str(e).lower():
+                    # Our token estimate was optimistic - do not retry this prefix
+                    if len(self._too_small) >= 4096:
+                        self._too_small.clear()
+                    self._too_small.add(key)
+                else:
+                    self._disabled_until = self._clock() + self.disable_seconds
+            return
+
+        evicted = []
+        with self._lock:
+            self._pending.discard(key)
+            self._entries[key] = CachedPrefix(cached.name, self._clock() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+        METRICS.inc('gemini_prefix_cache_creates_total')
+        for entry in evicted:
+            self._executor.submit(self._delete, entry.name)
+
+    def _schedule_refresh(self, entry: CachedPrefix):
+        with self._lock:
+            if entry.name in self._pending:
+                return
+            self._pending.add(entry.name)
+        self._executor.submit(self._refresh, entry)
+
+    def _refresh(self, entry: CachedPrefix):
+        try:
+            self.client.caches.update(name=entry.name, config={'ttl': f"{int(self.ttl_seconds)}s"})
+            entry.expires_at = self._clock() + self.ttl_seconds
+        except Exception:
+            METRICS.inc('gemini_prefix_cache_errors_total')
+        finally:
+            with self._lock:
+                self._pending.discard(entry.name)
+
+    def _delete(self, name: str):
+        try:
+            self.client.caches.delete(name=name)
+        except Exception:
+            pass  # it expires on its own
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+
+MODEL_FIELDS = ('role', 'content')
+
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """
+    How much conversation history to send to a model.
+
+    The last `recent_turns` turns (a user message and the replies that follow
+    it) are kept verbatim. Older messages are either dropped or compressed to
+    `compressed_chars` characters, and the oldest messages are then removed
+    until the estimated size fits within `max_tokens`.
+
+    With `trim_turns` above 1, both boundaries move `trim_turns` whole turns
+    at a time, so the start of the window stays the same for several turns
+    and a cached prefix of it keeps matching. The window then holds up to
+    `trim_turns - 1` more verbatim turns, or that many fewer turns when the
+    token budget is what trims it.
+    """
+    recent_turns: int = 8
+    max_tokens: int = 4000
+    older_turns: str = 'compress'  # 'compress' or 'drop'
+    compressed_chars: int = 200
+    trim_turns: int = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def strip_message(message: dict) -> dict:
+    """Keep only the fields a model consumes - drop analysis and UI state."""
+    return {field: message.get(field, '') for field in MODEL_FIELDS}
+
+
+def compress_message(message: dict, max_chars: int) -> dict:
+    content = message['content']
+    if len(content) <= max_chars:
+        return message
+    return {'role': message['role'], 'content': content[:max_chars].rstrip() + '…'}
+
+
+def verbatim_messages(policy: ContextPolicy) -> int:
+    """How many trailing messages `apply_context_policy` may keep verbatim: two per recent turn, and per extra turn a step may keep."""
+    return 2 * (policy.recent_turns + max(1, policy.trim_turns) - 1)
+
+
+def messages_needed(policy: ContextPolicy) -> int:
+    """
+    How many trailing messages `apply_context_policy` draws on: the verbatim
+    ones plus the older messages that fit the token budget at their
+    compressed length.
+    """
+    older = 0
+    if policy.older_turns == 'compress':
+        older = policy.max_tokens // estimate_tokens('x' * policy.compressed_chars)
+    return verbatim_messages(policy) + older
+
+
+def apply_context_policy(messages: list, policy: ContextPolicy) -> list:
+    """Return the stripped, windowed message list to send to a model."""
+    step = max(1, policy.trim_turns)
+    user_positions = [i for i, m in enumerate(messages) if m.get('role') == 'user']
+    turn_of = {position: turn for turn, position in enumerate(user_positions)}
+
+    # Find where the last `recent_turns` turns begin, rounded down to a whole step
+    start = 0
+    first_recent = len(user_positions) - policy.recent_turns
+    if first_recent >= 0:
+        start = user_positions[first_recent - first_recent % step]
+
+    window = [strip_message(m) for m in messages[start:]]
+    positions = list(range(start, len(messages)))
+    if start and policy.older_turns == 'compress':
+        older = [compress_message(strip_message(m), policy.compressed_chars) for m in messages[:start]]
+        window = older + window
+        positions = list(range(len(messages)))
+
+    # Drop the oldest messages until the window fits the token budget,
+    # always keeping the latest message
+    sizes = [estimate_tokens(m['content']) for m in window]
+    total = sum(sizes)
+    first = 0
+    while total > policy.max_tokens and first < len(window) - 1:
+        total -= sizes[first]
+        first += 1
+    trimmed = first > 0
+
+    # Models expect the conversation to open with a user message; a trimmed
+    # window also opens on a whole step, so its start holds for `step` turns
+    while first < len(window) - 1 and (
+            window[first]['role'] != 'user' or (trimmed and turn_of[positions[first]] % step)):
+        first += 1
+
+    return window[first:]
@@ -0,0 +1,56 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, TimeoutError, wait
+
+
+def hedged_call(executor, fn, hedge_after: float = None):
+    """
+    Call `fn()` on `executor`, sending an identical second request if the
+    first has not finished within `hedge_after` seconds.
+
+    Returns the first successful result. If one request fails, the other
+    is still awaited; the error is only raised when both fail. Without
+    `hedge_after` this is a plain call on the executor.
+    """
+    first = executor.submit(fn)
+    if not hedge_after:
+        return first.result()
+    try:
+        return first.result(timeout=hedge_after)
+    except TimeoutError:
+        pass
+
+    second = executor.submit(fn)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def hedged_call_async(fn, hedge_after: float = None):
+    """`hedged_call` for coroutines: `fn()` returns an awaitable, and the hedge is a second task."""
+    first = asyncio.ensure_future(fn())
+    if not hedge_after:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    second = asyncio.ensure_future(fn())
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
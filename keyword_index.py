@@ -0,0 +1,85 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from topics import TOPIC_KEYWORDS
+
+
+def _trie_pattern(words) -> str:
+    """Regex matching any of `words`, preferring the longest, as a nested character trie."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word ends here too - the greedy optional tries the longer words first
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordIndex:
+    """
+    Precompiled multi-keyword topic matcher.
+
+    All keywords are compiled into one case-insensitive alternation regex
+    anchored on word boundaries, so a text is scanned once regardless of the
+    number of keywords, and 'pm' does not match inside 'npm'. The alternation
+    is factored into a character trie so the regex engine never retries
+    keywords that share a prefix. Each matched
+    keyword adds its word count to the score of every topic it belongs to,
+    so multi-word phrases outweigh single words; the highest score wins.
+    """
+
+    def __init__(self, keywords: dict):
+        self._labels = list(keywords)
+        self._topics_by_keyword = defaultdict(list)
+        for label_id, label in enumerate(self._labels):
+            for keyword in keywords[label]:
+                self._topics_by_keyword[keyword.lower()].append(label_id)
+
+        self._pattern = re.compile(
+            r"\b(" + _trie_pattern(self._topics_by_keyword) + r")(?:s|es)?(?!\w)",
+            re.IGNORECASE
+        )
+
+    def scores(self, text: str) -> dict:
+        """Map label index to score for every topic with at least one keyword match."""
+        scores = defaultdict(int)
+        for match in self._pattern.finditer(text):
+            keyword = match.group(1).lower()
+            weight = keyword.count(' ') + 1
+            for label_id in self._topics_by_keyword[keyword]:
+                scores[label_id] += weight
+        return scores
+
+    def classify(self, text: str):
+        """Return the best matching {'level_1', 'level_2'} topic, or None if nothing matches."""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        # Ties go to the topic listed first in the keyword table
+        label_id = min(scores, key=lambda i: (-scores[i], i))
+        level_1, level_2 = self._labels[label_id]
+        return {'level_1': level_1, 'level_2': level_2}
+
+    def classify_many(self, texts) -> list:
+        """Classify a batch of texts; entries are None where nothing matches."""
+        return [self.classify(text) for text in texts]
+
+
+@lru_cache(maxsize=1)
+def get_keyword_index() -> KeywordIndex:
+    """The shared index built from TOPIC_KEYWORDS."""
+    return KeywordIndex(TOPIC_KEYWORDS)
+
+
+def classify_many(texts) -> list:
+    return get_keyword_index().classify_many(texts)
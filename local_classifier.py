@@ -0,0 +1,143 @@
+"""
+CPU-only topic classifier used when the Modal tagger is unavailable.
+
+Texts are turned into hashed bag-of-features vectors (words, word bigrams and
+character trigrams), and each level_2 topic has a centroid vector built from
+its TOPIC_KEYWORDS entry. Classifying a batch is one matrix multiply of the
+normalized feature matrix against the centroid matrix.
+
+The centroid matrix ships as topic_weights.npy and is memory-mapped on load,
+with a fingerprint of the labels, TOPIC_KEYWORDS and FEATURE_DIM next to it;
+weights whose fingerprint does not match are rebuilt in memory. Rebuild the
+file after changing TOPIC_KEYWORDS or the feature hashing:
+
+    python local_classifier.py build
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from topics import TOPIC_HIERARCHY, TOPIC_KEYWORDS
+
+FEATURE_DIM = 4096  # must be a power of two
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topic_weights.npy')
+MIN_SCORE = 0.15
+
+LABELS = [(level_1, level_2) for level_1, level_2s in TOPIC_HIERARCHY.items() for level_2 in level_2s]
+
+_WORD_RE = re.compile(r"\w+")
+
+# Words too common to say anything about the topic
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for with about from by is are was were be been am
+i me my you your we our it its this that these those what which who whom how why when where
+can could would should will do does did say said tell please some any there here
+ok okay thanks thank good
+""".split())
+
+
+def weights_fingerprint() -> str:
+    """Hash of everything the centroid matrix is built from."""
+    keywords = sorted([list(label), words] for label, words in TOPIC_KEYWORDS.items())
+    source = json.dumps([FEATURE_DIM, LABELS, keywords, sorted(STOPWORDS)], ensure_ascii=False)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def fingerprint_path(path: str) -> str:
+    return f"{path}.sha256"
+
+
+def feature_indices(text: str) -> list:
+    """Hashed feature indices for `text`: words, word bigrams and character trigrams."""
+    words = [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+    features = list(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"<{word}>"
+        features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return [zlib.crc32(feature.encode('utf-8')) & (FEATURE_DIM - 1) for feature in features]
+
+
+def vectorize(texts) -> np.ndarray:
+    """L2-normalized feature matrix with one row per text."""
+    matrix = np.zeros((len(texts), FEATURE_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices = feature_indices(text)
+        if indices:
+            matrix[row] = np.bincount(indices, minlength=FEATURE_DIM)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def build_weights() -> np.ndarray:
+    """Centroid matrix with one L2-normalized row per label in LABELS."""
+    weights = np.zeros((len(LABELS), FEATURE_DIM), dtype=np.float32)
+    for row, (level_1, level_2) in enumerate(LABELS):
+        examples = [level_2] + TOPIC_KEYWORDS.get((level_1, level_2), [])
+        weights[row] = vectorize(examples).sum(axis=0)
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    np.divide(weights, norms, out=weights, where=norms > 0)
+    return weights
+
+
+class LocalClassifier:
+    """Nearest-centroid classifier over the hashed feature space."""
+
+    def __init__(self, weights: np.ndarray, min_score: float = MIN_SCORE):
+        if weights.shape != (len(LABELS), FEATURE_DIM):
+            raise ValueError(f"Expected weights of shape {(len(LABELS), FEATURE_DIM)}, got {weights.shape}")
+        self.weights = weights
+        self.min_score = min_score
+
+    @classmethod
+    def load(cls, path: str = WEIGHTS_PATH, min_score: float = MIN_SCORE):
+        """Memory-map the shipped weights, rebuilding them if missing or stale."""
+        try:
+            with open(fingerprint_path(path), 'r', encoding='utf-8') as f:
+                if f.read().strip() != weights_fingerprint():
+                    raise ValueError("weights were built from different keywords")
+            return cls(np.load(path, mmap_mode='r'), min_score)
+        except (OSError, ValueError):
+            return cls(build_weights(), min_score)
+
+    def classify_many(self, texts) -> list:
+        """Classify a batch of texts; entries are None where no topic scores above `min_score`."""
+        texts = list(texts)
+        if not texts:
+            return []
+        scores = vectorize(texts) @ self.weights.T
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(texts)), best]
+        results = []
+        for label_id, score in zip(best.tolist(), best_scores.tolist()):
+            if score < self.min_score:
+                results.append(None)
+            else:
+                level_1, level_2 = LABELS[label_id]
+                results.append({'level_1': level_1, 'level_2': level_2})
+        return results
+
+    def classify(self, text: str):
+        return self.classify_many([text])[0]
+
+
+@lru_cache(maxsize=1)
+def get_local_classifier() -> LocalClassifier:
+    return LocalClassifier.load()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ['build']:
+        sys.exit("Usage: python local_classifier.py build [path]")
+    path = sys.argv[2] if len(sys.argv) > 2 else WEIGHTS_PATH
+    np.save(path, build_weights())
+    with open(fingerprint_path(path), 'w', encoding='utf-8') as f:
+        f.write(weights_fingerprint() + "\n")
+    print(f"Wrote {len(LABELS)}x{FEATURE_DIM} weights to {path}")
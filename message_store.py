@@ -0,0 +1,234 @@
+"""
+Compact per-session conversation storage with spill-to-disk for old turns.
+
+Messages are slotted records rather than dicts, with role and topic strings
+interned so every session shares one copy of each. Only the most recent
+`memory_window` messages stay in memory; older ones are written to a
+per-session SQLite file and read back a page at a time when needed.
+Spilled messages that models still see in compressed form also keep a
+short in-memory digest, so building model context does not read disk.
+"""
+from collections import deque
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+import weakref
+
+from context_window import compress_message
+
+# Message fields that are kept when a message is spilled to disk
+SPILLED_ANALYSIS_FIELDS = ('expanded_query', 'topic', 'error', 'warning')
+
+
+def intern_analysis(analysis):
+    """Intern the topic labels of an analysis dict in place."""
+    if isinstance(analysis, dict):
+        topic = analysis.get('topic')
+        if isinstance(topic, dict):
+            for level in ('level_1', 'level_2'):
+                if isinstance(topic.get(level), str):
+                    topic[level] = sys.intern(topic[level])
+    return analysis
+
+
+class Message:
+    """A chat message with dict-style access, so it can stand in for the plain dicts used elsewhere."""
+
+    __slots__ = ('role', 'content', 'analysis', '_render')
+
+    def __init__(self, role: str, content: str, analysis: dict = None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.analysis = intern_analysis(analysis)
+        self._render = None
+
+    def get(self, key: str, default=None):
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        if key == 'analysis':
+            value = intern_analysis(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def to_dict(self) -> dict:
+        message = {'role': self.role, 'content': self.content}
+        if self.analysis is not None:
+            message['analysis'] = self.analysis
+        return message
+
+    @classmethod
+    def from_dict(cls, message: dict):
+        return cls(message['role'], message['content'], message.get('analysis'))
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ConversationStore:
+    """
+    Sequence of Messages for one session, with bounded memory.
+
+    Supports len(), indexing and slicing (spilled messages are loaded
+    lazily), iteration, append and clear. `tail(n)` returns the newest
+    messages without touching disk as long as n is within the memory window.
+
+    Spills never leave fewer than `keep_recent` messages in memory. The
+    last `digest_count` spilled messages are also kept compressed to
+    `digest_chars` characters for `context_tail`.
+    """
+
+    def __init__(self, memory_window: int = 50, spill_dir: str = None, keep_recent: int = 0,
+                 digest_chars: int = 200, digest_count: int = 0):
+        self.memory_window = memory_window
+        self.keep_recent = keep_recent
+        self.digest_chars = digest_chars
+        self._spill_dir = spill_dir or tempfile.gettempdir()
+        self._recent = []
+        self._digests = deque(maxlen=digest_count)
+        self._spilled = 0
+        self._db = None
+        self._db_path = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._recent)
+
+    def __iter__(self):
+        if self._spilled:
+            yield from self._load(0, self._spilled)
+        yield from list(self._recent)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            messages = []
+            if start < self._spilled:
+                messages.extend(self._load(start, min(stop, self._spilled)))
+            if stop > self._spilled:
+                messages.extend(self._recent[max(0, start - self._spilled):stop - self._spilled])
+            return messages
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index >= self._spilled:
+            return self._recent[index - self._spilled]
+        return self._load(index, index + 1)[0]
+
+    def append(self, message):
+        if not isinstance(message, Message):
+            message = Message.from_dict(message)
+        self._recent.append(message)
+        # Spill in chunks so appends do not hit disk every time
+        spill = len(self._recent) - max(self.memory_window // 2, self.keep_recent)
+        if len(self._recent) > self.memory_window and spill > 0:
+            self._spill(spill)
+        return message
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def tail(self, count: int) -> list:
+        """The newest `count` messages (fewer if the conversation is shorter)."""
+        if count <= len(self._recent):
+            return self._recent[len(self._recent) - count:]
+        return self[max(0, len(self) - count):]
+
+    def context_tail(self, count: int) -> list:
+        """
+        Like `tail`, but spilled messages come from their digests where
+        possible - enough for a context policy that compresses them anyway.
+        """
+        older = min(count, len(self)) - len(self._recent)
+        if older <= 0:
+            return self.tail(count)
+        if older > len(self._digests):
+            return self.tail(count)
+        return list(self._digests)[len(self._digests) - older:] + self._recent
+
+    def recent(self) -> list:
+        """The messages currently held in memory, oldest first."""
+        return list(self._recent)
+
+    def clear(self):
+        with self._lock:
+            self._recent = []
+            self._digests.clear()
+            self._spilled = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM messages")
+                self._db.commit()
+
+    @property
+    def spilled(self) -> int:
+        return self._spilled
+
+    def _connect(self):
+        if self._db is None:
+            self._db_path = os.path.join(self._spill_dir, f"conversation-{uuid.uuid4().hex}.sqlite3")
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE messages (position INTEGER PRIMARY KEY, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, analysis TEXT)"
+            )
+            # Session state has no end-of-session hook - remove the file once the store is collected
+            weakref.finalize(self, _remove_file, self._db_path)
+        return self._db
+
+    def _spill(self, count: int):
+        with self._lock:
+            db = self._connect()
+            rows = []
+            for offset, message in enumerate(self._recent[:count]):
+                analysis = message.analysis
+                if analysis:
+                    analysis = {k: analysis[k] for k in SPILLED_ANALYSIS_FIELDS if k in analysis}
+                rows.append((
+                    self._spilled + offset,
+                    message.role,
+                    message.content,
+                    json.dumps(analysis, ensure_ascii=False) if analysis else None,
+                ))
+            db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?)", rows)
+            db.commit()
+            if self._digests.maxlen:
+                self._digests.extend(
+                    Message(m.role, compress_message(m.to_dict(), self.digest_chars)['content'])
+                    for m in self._recent[:count][-self._digests.maxlen:]
+                )
+            self._recent = self._recent[count:]
+            self._spilled += count
+
+    def _load(self, start: int, stop: int) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content, analysis FROM messages WHERE position >= ? AND position < ? ORDER BY position",
+                (start, stop)
+            ).fetchall()
+        return [Message(role, content, json.loads(analysis) if analysis else None) for role, content, analysis in rows]
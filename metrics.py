@@ -0,0 +1,152 @@
+"""
+In-process latency histograms and counters, exported as JSON or Prometheus text.
+
+    with REGISTRY.span('modal_infer'):
+        result = service.infer.remote(messages=messages)
+    REGISTRY.inc('fallbacks_total')
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Count and sum of all observations, plus a sliding window of recent ones for quantiles."""
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self._recent.append(value)
+
+    def quantiles(self) -> dict:
+        if not self._recent:
+            return {q: 0.0 for q in QUANTILES}
+        ordered = sorted(self._recent)
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name: str, value: float):
+        """Record the current value of a gauge, such as a one-off startup timing."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block into the `name` histogram, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'latency_seconds': {
+                    name: {
+                        'count': h.count,
+                        'sum': h.total,
+                        **{f'p{int(q * 100)}': value for q, value in h.quantiles().items()},
+                    }
+                    for name, h in self._histograms.items()
+                },
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix: str = 'tagging_ui') -> str:
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                lines.append(f"{prefix}_{name} {value}")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+            if self._histograms:
+                metric = f"{prefix}_stage_latency_seconds"
+                lines.append(f"# TYPE {metric} summary")
+                for name, h in sorted(self._histograms.items()):
+                    for q, value in h.quantiles().items():
+                        lines.append(f'{metric}{{stage="{name}",quantile="{q}"}} {value:.6f}')
+                    lines.append(f'{metric}_sum{{stage="{name}"}} {h.total:.6f}')
+                    lines.append(f'{metric}_count{{stage="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_http_exporter(port: int, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1'):
+    """Serve /metrics (Prometheus text) and /metrics.json from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = registry.to_json(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_exporter(path: str, interval: float = 10.0, registry: MetricsRegistry = REGISTRY):
+    """Rewrite `path` with the JSON snapshot every `interval` seconds from a background thread."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(registry.to_json())
+            os.replace(tmp_path, path)
+
+    thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,87 @@
+import threading
+
+from circuit_breaker import HALF_OPEN, CircuitBreaker
+from tagging import MODAL_APP_NAME, MODAL_CLASS_NAME
+
+
+def resolve_service():
+    """Look up the deployed QueryExpansionService and return an instance of it."""
+    import modal
+
+    QueryExpansionService = modal.Cls.from_name(MODAL_APP_NAME, MODAL_CLASS_NAME)
+    # from_name is lazy - hydrate to find out now whether the app is deployed
+    hydrate = getattr(QueryExpansionService, 'hydrate', None)
+    if hydrate is not None:
+        hydrate()
+    return QueryExpansionService()
+
+
+# Smallest conversation the health probe sends through `infer`
+PROBE_MESSAGES = [{'role': 'user', 'content': 'ping'}]
+
+
+class ModalServiceHandle:
+    """
+    Resolved Modal service guarded by a circuit breaker.
+
+    A failed lookup is not cached for good: while the breaker is open, a
+    background health check re-resolves the service each time the breaker's
+    backoff expires and sends it a one-message `infer` call. Only a call
+    that succeeds closes the breaker - a deployed app whose calls time out
+    keeps it open, with the backoff growing.
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, resolve=resolve_service, health_interval: float = 2.0):
+        self.breaker = breaker or CircuitBreaker()
+        self._resolve = resolve
+        self._health_interval = health_interval
+        self._service = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._health_thread = None
+
+    def get_service(self):
+        """The resolved service, resolving it first if needed. None (and the breaker trips) if lookup fails."""
+        with self._lock:
+            if self._service is None:
+                try:
+                    self._service = self._resolve()
+                except Exception:
+                    self.breaker.trip()
+                    return None
+            return self._service
+
+    @property
+    def resolved(self):
+        """The service if it has already been resolved, else None - never blocks on a lookup."""
+        return self._service
+
+    def start_health_check(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, name="modal-health", daemon=True)
+            self._health_thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _health_loop(self):
+        while not self._stopped.wait(self._health_interval):
+            # Probe once the backoff has expired, unless a live call already took the probe slot
+            if self.breaker.state == HALF_OPEN and self.breaker.allow():
+                self.probe()
+
+    def probe(self):
+        """Re-resolve the service, make one small `infer` call and report the outcome to the breaker."""
+        try:
+            service = self._resolve()
+            result = service.infer.remote(messages=PROBE_MESSAGES)
+            if isinstance(result, dict) and result.get('error'):
+                raise RuntimeError(result['error'])
+        except Exception:
+            self.breaker.record_failure()
+            return False
+        with self._lock:
+            self._service = service
+        self.breaker.record_success()
+        return True
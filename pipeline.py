@@ -0,0 +1,203 @@
+"""The query analysis pipeline: context window, cache, single-flight, circuit breaker, Modal call and fallback."""
+import asyncio
+from contextlib import nullcontext
+
+from admission import AdmissionController
+from analysis_cache import AnalysisCache, cache_key
+from async_backend import call_remote
+from batching import DEFAULT_BATCH_METHOD, MicroBatcher, infer_batch
+from context_window import ContextPolicy, apply_context_policy
+from hedging import hedged_call, hedged_call_async
+from metrics import REGISTRY as METRICS
+from modal_service import ModalServiceHandle
+from singleflight import AsyncSingleFlight, SingleFlight
+from tagging import (
+    MODAL_UNAVAILABLE_ERROR,
+    get_fallback_analysis,
+    interpret_exception,
+    interpret_result,
+    unavailable_analysis,
+)
+
+
+class AnalysisPipeline:
+    """
+    Get expanded query and topic classification for a conversation.
+
+    The conversation is windowed to `policy`, looked up in `cache`, and
+    otherwise sent to the Modal service behind `handle`'s circuit breaker.
+    Concurrent misses for the same conversation share one remote call.
+    `analyze_async` is the same pipeline for coroutines on an AsyncBackend.
+    Remote calls run on `executor`, hedged after `hedge_after` seconds.
+
+    With a `batch_window` (seconds), remote calls from all sessions are
+    instead collected into batches of up to `batch_max` and sent through the
+    service's `batch_method`, or spawned together if it has none. Batched
+    calls are not hedged.
+
+    With an `admission` controller, each Modal call is tracked as a 'tagger'
+    call; cache hits and breaker fast-fails are not, so they do not hide a
+    slow service.
+    """
+
+    def __init__(self, handle: ModalServiceHandle, cache: AnalysisCache, policy: ContextPolicy,
+                 executor, hedge_after: float = None, batch_window: float = None, batch_max: int = 16,
+                 batch_method: str = DEFAULT_BATCH_METHOD, admission: AdmissionController = None):
+        self.handle = handle
+        self.admission = admission
+        self.cache = cache
+        self.policy = policy
+        self.executor = executor
+        self.hedge_after = hedge_after
+        self.batch_method = batch_method
+        self.flights = SingleFlight('analysis_coalesced')
+        self.async_flights = AsyncSingleFlight('analysis_coalesced')
+        self.batcher = None
+        if batch_window:
+            self.batcher = MicroBatcher(self._infer_batch, window=batch_window, max_batch=batch_max,
+                                        executor=executor)
+
+    def _infer_batch(self, conversations: list) -> list:
+        service = self.handle.get_service()
+        if service is None:
+            raise ConnectionError(MODAL_UNAVAILABLE_ERROR)
+        return infer_batch(service, conversations, self.batch_method)
+
+    def _infer(self, service, messages: list):
+        if self.batcher is not None:
+            return self.batcher.submit(messages).result()
+        return hedged_call(
+            self.executor,
+            lambda: service.infer.remote(messages=messages),
+            hedge_after=self.hedge_after
+        )
+
+    async def _infer_async(self, service, messages: list):
+        if self.batcher is not None:
+            return await asyncio.wrap_future(self.batcher.submit(messages))
+        return await hedged_call_async(
+            lambda: call_remote(service.infer, messages=messages),
+            hedge_after=self.hedge_after
+        )
+
+    def _track(self):
+        return self.admission.track('tagger') if self.admission is not None else nullcontext()
+
+    def coalescing_stats(self) -> dict:
+        """Single-flight stats summed over the blocking and async paths."""
+        sync, aio = self.flights.stats(), self.async_flights.stats()
+        return {name: sync[name] + aio[name] for name in sync}
+
+    def analyze(self, messages: list) -> dict:
+        """
+        Args:
+            messages: List of message dicts with 'role' and 'content' keys
+
+        Returns:
+            dict with 'expanded_query', 'topic' (level_1, level_2), and optional 'error'
+        """
+        messages, key, analysis = self._prepare(messages)
+        if analysis is not None:
+            return analysis
+        return self.flights.do(key, lambda: self._remote_analysis(key, messages))
+
+    async def analyze_async(self, messages: list) -> dict:
+        """`analyze` for an event loop: the Modal call is awaited instead of blocking a thread."""
+        # The cache lookup may read SQLite - keep it off the loop
+        messages, key, analysis = await asyncio.to_thread(self._prepare, messages)
+        if analysis is not None:
+            return analysis
+        return await self.async_flights.do(key, lambda: self._remote_analysis_async(key, messages))
+
+    def _prepare(self, messages: list):
+        """Window the conversation and try the cache: (messages, key, cached analysis or None)."""
+        messages = apply_context_policy(messages, self.policy)
+
+        key = cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            METRICS.inc('analysis_cache_hits_total')
+            return messages, key, cached
+        METRICS.inc('analysis_cache_misses_total')
+        return messages, key, None
+
+    def _breaker_fallback(self, messages: list) -> dict:
+        # Fail fast while the breaker is open instead of waiting out a timeout
+        METRICS.inc('breaker_rejections_total')
+        fallback = get_fallback_analysis(messages)
+        fallback['warning'] = "Modal service is unavailable - showing locally generated tags."
+        return fallback
+
+    def _remote_analysis(self, key: str, messages: list) -> dict:
+        # A call that finished between our cache miss and taking the flight has already cached its result
+        cached = self.cache.get(key, count=False)
+        if cached is not None:
+            return cached
+        # Ask the breaker only now: in HALF_OPEN this takes the single probe
+        # slot, and every path below reports an outcome that frees it
+        if not self.handle.breaker.allow():
+            return self._breaker_fallback(messages)
+
+        with METRICS.span('modal_lookup'):
+            service = self.handle.get_service()
+        if service is None:
+            METRICS.inc('analysis_errors_total')
+            return unavailable_analysis()
+
+        try:
+            # Call modal service with chat history
+            with METRICS.span('modal_infer'), self._track():
+                result = self._infer(service, messages)
+        except Exception as e:
+            return self._record_exception(e, messages)
+        return self._record_result(key, result, messages)
+
+    async def _remote_analysis_async(self, key: str, messages: list) -> dict:
+        cached = await asyncio.to_thread(self.cache.get, key, count=False)
+        if cached is not None:
+            return cached
+        if not self.handle.breaker.allow():
+            return await asyncio.to_thread(self._breaker_fallback, messages)
+        try:
+            return await self._call_remote_async(key, messages)
+        except asyncio.CancelledError:
+            # A cancelled call reports no outcome - give back the probe slot if it held it
+            self.handle.breaker.release()
+            raise
+
+    async def _call_remote_async(self, key: str, messages: list) -> dict:
+        with METRICS.span('modal_lookup'):
+            # The first lookup talks to Modal - keep it off the event loop
+            service = self.handle.resolved or await asyncio.to_thread(self.handle.get_service)
+        if service is None:
+            METRICS.inc('analysis_errors_total')
+            return unavailable_analysis()
+
+        try:
+            with METRICS.span('modal_infer'), self._track():
+                result = await self._infer_async(service, messages)
+        except Exception as e:
+            return await asyncio.to_thread(self._record_exception, e, messages)
+        # Interpreting may run the fallback classifier and recording writes the SQLite cache
+        return await asyncio.to_thread(self._record_result, key, result, messages)
+
+    def _record_result(self, key: str, result, messages: list) -> dict:
+        try:
+            analysis = interpret_result(result, messages)
+        except Exception as e:
+            return self._record_exception(e, messages)
+        return self._record_analysis(key, analysis)
+
+    def _record_exception(self, e: Exception, messages: list) -> dict:
+        METRICS.inc('analysis_errors_total')
+        self.handle.breaker.record_failure()
+        return interpret_exception(e, messages)
+
+    def _record_analysis(self, key: str, analysis: dict) -> dict:
+        if analysis.get('error'):
+            METRICS.inc('analysis_errors_total')
+            self.handle.breaker.record_failure()
+            return analysis
+        self.handle.breaker.record_success()
+        self.cache.put(key, analysis)
+        return analysis
@@ -0,0 +1,49 @@
+"""HTML for chat messages, built once per message and memoized on the message dict."""
+import html
+
+# Key under which the rendered HTML is memoized on a message dict. Fields other
+# than role/content are stripped before messages are sent to any model.
+RENDER_CACHE_KEY = '_render'
+
+
+def build_topic_html(topic) -> str:
+    # Build topic tags HTML only if topic exists and has valid values
+    if topic and isinstance(topic, dict) and topic.get('level_1') and topic.get('level_2'):
+        return f'<div class="topic-tag-container"><span class="topic-badge">{html.escape(str(topic["level_1"]))}</span><span class="topic-sep">›</span><span class="topic-badge active">{html.escape(str(topic["level_2"]))}</span></div>'
+    return ""
+
+
+def build_expanded_query_html(expanded_query) -> str:
+    # Build expanded query HTML only if expanded_query exists and is not empty
+    if expanded_query:
+        return f'<div class="expanded-query-container"><div class="expanded-query-label">EXPANDED QUERY</div><div class="expanded-query-value">{html.escape(str(expanded_query))}</div></div>'
+    return ""
+
+
+def build_user_message_html(content: str, analysis):
+    """HTML for a tagged user message, or None if there is nothing to show besides the text."""
+    if not analysis:
+        return None
+    topic_html = build_topic_html(analysis.get('topic'))
+    expanded_query_html = build_expanded_query_html(analysis.get('expanded_query'))
+
+    # Only show formatted message if we have at least topic or expanded query
+    if not topic_html and not expanded_query_html:
+        return None
+    return f'<div class="user-message-container"><div class="message-top-row"><div class="message-text-area">{html.escape(str(content))}</div>{topic_html}</div>{expanded_query_html}</div>'
+
+
+def user_message_html(message: dict):
+    """
+    Memoized build_user_message_html for a stored message.
+
+    The cache entry remembers which analysis object it was built from, so
+    replacing message['analysis'] invalidates it.
+    """
+    analysis = message.get('analysis')
+    cached = message.get(RENDER_CACHE_KEY)
+    if cached is not None and cached[0] is analysis:
+        return cached[1]
+    rendered = build_user_message_html(message['content'], analysis)
+    message[RENDER_CACHE_KEY] = (analysis, rendered)
+    return rendered
@@ -0,0 +1,109 @@
+"""
+Builders for the shared backend objects from a settings mapping.
+
+The Streamlit app passes st.secrets and the HTTP API passes os.environ, so
+both read the same setting names with the same defaults. Values may be
+strings (environment variables) or typed (secrets.toml).
+"""
+from admission import AdmissionController
+from analysis_cache import AnalysisCache
+from chat import GEMINI_CONFIG
+from circuit_breaker import CircuitBreaker
+from context_cache import PrefixCache
+from context_window import ContextPolicy
+from modal_service import ModalServiceHandle
+from pipeline import AnalysisPipeline
+
+# Default context budgets per model - the tagger only needs recent turns
+CONTEXT_DEFAULTS = {
+    'TAGGER': ContextPolicy(recent_turns=4, max_tokens=1024),
+    # The chat window is trimmed four turns at a time so Gemini prefix caches keep matching
+    'CHAT': ContextPolicy(recent_turns=12, max_tokens=8000, trim_turns=4),
+}
+
+
+def context_policy(settings, name: str) -> ContextPolicy:
+    """Context window policy for 'TAGGER' or 'CHAT'."""
+    default = CONTEXT_DEFAULTS[name]
+    return ContextPolicy(
+        recent_turns=int(settings.get(f'{name}_CONTEXT_TURNS', default.recent_turns)),
+        max_tokens=int(settings.get(f'{name}_CONTEXT_TOKENS', default.max_tokens)),
+        older_turns=settings.get(f'{name}_CONTEXT_OLDER_TURNS', default.older_turns),
+        compressed_chars=int(settings.get(f'{name}_CONTEXT_COMPRESSED_CHARS', default.compressed_chars)),
+        trim_turns=int(settings.get(f'{name}_CONTEXT_TRIM_TURNS', default.trim_turns))
+    )
+
+
+def modal_service(settings) -> ModalServiceHandle:
+    """Modal service handle with its circuit breaker and background health check."""
+    breaker = CircuitBreaker(
+        failure_threshold=float(settings.get('MODAL_BREAKER_FAILURE_RATE', 0.5)),
+        min_calls=int(settings.get('MODAL_BREAKER_MIN_CALLS', 4)),
+        open_seconds=float(settings.get('MODAL_BREAKER_OPEN_SECONDS', 5)),
+        max_open_seconds=float(settings.get('MODAL_BREAKER_MAX_OPEN_SECONDS', 300))
+    )
+    return ModalServiceHandle(breaker).start_health_check()
+
+
+def analysis_cache(settings) -> AnalysisCache:
+    return AnalysisCache(
+        max_entries=int(settings.get('ANALYSIS_CACHE_SIZE', 1024)),
+        ttl_seconds=float(settings.get('ANALYSIS_CACHE_TTL', 3600)),
+        path=settings.get('ANALYSIS_CACHE_PATH') or None
+    )
+
+
+def analysis_pipeline(settings, handle: ModalServiceHandle, cache: AnalysisCache, executor,
+                      admission: AdmissionController = None) -> AnalysisPipeline:
+    return AnalysisPipeline(
+        handle=handle,
+        cache=cache,
+        policy=context_policy(settings, 'TAGGER'),
+        executor=executor,
+        hedge_after=float(settings.get('TAGGER_HEDGE_SECONDS', 0)) or None,
+        batch_window=float(settings.get('TAGGER_BATCH_WINDOW_MS', 0)) / 1000 or None,
+        batch_max=int(settings.get('TAGGER_BATCH_MAX', 16)),
+        batch_method=settings.get('MODAL_BATCH_METHOD', 'infer_batch'),
+        admission=admission
+    )
+
+
+def _levels(value, cast) -> tuple:
+    """Thresholds given as a list, or as a comma-separated string in the environment."""
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(cast(v) for v in value)
+
+
+def admission_controller(settings) -> AdmissionController:
+    return AdmissionController(
+        inflight_levels=_levels(settings.get('ADMISSION_INFLIGHT_LEVELS', (48, 96, 160)), int),
+        latency_levels=_levels(settings.get('ADMISSION_LATENCY_LEVELS', (10.0, 20.0, 40.0)), float),
+        window_seconds=float(settings.get('ADMISSION_WINDOW_SECONDS', 30))
+    )
+
+
+def short_reply_settings(settings):
+    """Context policy and Gemini config for replies under load: fewer turns in, fewer tokens out."""
+    policy = ContextPolicy(
+        recent_turns=int(settings.get('DEGRADED_CHAT_CONTEXT_TURNS', 4)),
+        max_tokens=int(settings.get('DEGRADED_CHAT_CONTEXT_TOKENS', 2000)),
+        older_turns='drop'
+    )
+    config = {**GEMINI_CONFIG, 'max_output_tokens': int(settings.get('DEGRADED_MAX_OUTPUT_TOKENS', 256))}
+    return policy, config
+
+
+def prefix_cache(settings, client):
+    """Gemini prefix cache for `client`, or None unless GEMINI_PREFIX_CACHE is on."""
+    enabled = settings.get('GEMINI_PREFIX_CACHE', False)
+    if isinstance(enabled, str):
+        enabled = enabled.lower() in ('1', 'true', 'yes')
+    if not enabled or client is None:
+        return None
+    return PrefixCache(
+        client,
+        ttl_seconds=float(settings.get('GEMINI_PREFIX_CACHE_TTL', 600)),
+        min_tokens=int(settings.get('GEMINI_PREFIX_CACHE_MIN_TOKENS', 1024)),
+        min_new_tokens=int(settings.get('GEMINI_PREFIX_CACHE_MIN_NEW_TOKENS', 1024))
+    )
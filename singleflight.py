@@ -0,0 +1,97 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+
+from metrics import REGISTRY as METRICS
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for the same result instead of starting their own.
+    Every caller, the first included, gets its own deep copy, so callers
+    may mutate what they receive. Once the call finishes the key is
+    forgotten - this is not a cache.
+    """
+
+    def __init__(self, name: str = 'singleflight'):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            METRICS.inc(f'{self.name}_shared_total')
+            return copy.deepcopy(future.result())
+
+        METRICS.inc(f'{self.name}_calls_total')
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return copy.deepcopy(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'calls': self.leaders, 'shared': self.shared}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines that all run on one event loop."""
+
+    def __init__(self, name: str = 'singleflight'):
+        self.name = name
+        self._calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """Await `fn()`, or the call already in flight for `key`."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            METRICS.inc(f'{self.name}_shared_total')
+            # Shielded, so a cancelled waiter does not cancel the call for everyone else
+            return copy.deepcopy(await asyncio.shield(future))
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        METRICS.inc(f'{self.name}_calls_total')
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return copy.deepcopy(result)
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {'in_flight': len(self._calls), 'calls': self.leaders, 'shared': self.shared}
@@ -0,0 +1,74 @@
+import queue
+import threading
+
+from analysis_cache import cache_key
+
+
+class TurnCalls:
+    """
+    The two remote calls of a chat turn - analysis and streamed reply - started together.
+
+    `analysis` is a future for the analysis. The reply is pumped into
+    `chunks` as text pieces, followed by None when it is complete or by the
+    exception that ended it. Started for a predicted next message, the calls
+    can run before the user sends it; `matches()` tells whether they are
+    still valid for the conversation actually sent, and `cancel()` stops
+    reading the reply.
+
+    Use `on_executor` for blocking calls run on a thread pool, or `on_loop`
+    for coroutines run on an AsyncBackend.
+    """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.key = cache_key(messages)
+        self.chunks = queue.Queue()
+        self.analysis = None
+        self._reply = None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def on_executor(cls, executor, messages: list, analyze, stream_reply):
+        """`analyze(messages)` returns the analysis; `stream_reply(messages)` yields text chunks."""
+        turn = cls(messages)
+        turn.analysis = executor.submit(analyze, messages)
+        turn._reply = executor.submit(turn._pump, stream_reply)
+        return turn
+
+    @classmethod
+    def on_loop(cls, backend, messages: list, analyze, stream_reply):
+        """Like `on_executor`, with `analyze` a coroutine function and `stream_reply` an async generator function."""
+        turn = cls(messages)
+        turn.analysis = backend.submit(analyze(messages))
+        turn._reply = backend.submit(turn._pump_async(stream_reply))
+        return turn
+
+    def _pump(self, stream_reply):
+        try:
+            stream = stream_reply(self.messages)
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    # Closing the generator drops the underlying HTTP stream
+                    getattr(stream, 'close', lambda: None)()
+                    return
+                self.chunks.put(chunk)
+            self.chunks.put(None)
+        except Exception as e:
+            self.chunks.put(e)
+
+    async def _pump_async(self, stream_reply):
+        try:
+            async for chunk in stream_reply(self.messages):
+                self.chunks.put(chunk)
+            self.chunks.put(None)
+        except Exception as e:
+            self.chunks.put(e)
+
+    def matches(self, messages: list) -> bool:
+        return cache_key(messages) == self.key
+
+    def cancel(self):
+        self._cancelled.set()
+        # On the event loop this cancels the reply coroutine; a thread-pool pump stops at its next chunk
+        self._reply.cancel()
+        # The analysis is left to finish: other sessions may share its call, and its result is cached
@@ -0,0 +1,130 @@
+"""Streamlit-free pieces of the query analysis pipeline, shared by the app and batch tools."""
+
+from functools import lru_cache
+
+from keyword_index import get_keyword_index
+from metrics import REGISTRY as METRICS
+
+MODAL_APP_NAME = "query-expansion-topic-tagging"
+MODAL_CLASS_NAME = "QueryExpansionService"
+
+MODAL_UNAVAILABLE_ERROR = "Modal instance is not running. Please start the Modal service."
+
+
+@lru_cache(maxsize=1)
+def local_classifier():
+    """The local classifier, or None without numpy. numpy is only imported on first use."""
+    try:
+        from local_classifier import get_local_classifier
+    except ImportError:  # numpy not installed - keyword index only
+        return None
+    return get_local_classifier()
+
+
+def unavailable_analysis() -> dict:
+    # Return empty strings with error - do not display topic tags and expanded query
+    return {
+        'expanded_query': '',
+        'topic': {},
+        'error': MODAL_UNAVAILABLE_ERROR
+    }
+
+
+def interpret_result(result, messages: list) -> dict:
+    """Turn a raw QueryExpansionService.infer result into an analysis dict."""
+    # Check for errors
+    if isinstance(result, dict) and 'error' in result:
+        # Check if error indicates Modal instance is not running
+        error_msg = result.get('error', '').lower()
+        if 'not running' in error_msg or 'not found' in error_msg or 'connection' in error_msg:
+            return unavailable_analysis()
+        else:
+            # For other errors, use fallback with warning
+            fallback = get_fallback_analysis(messages)
+            fallback['warning'] = f"Modal service error: {result.get('error')}"
+            if 'raw_output' in result:
+                fallback['raw_output'] = result['raw_output'][:100]
+            return fallback
+
+    # Extract labels from result
+    # Result should have 'labels' key with 'expanded_query' and 'topic'
+    labels = result.get('labels', {})
+    if not labels:
+        # If no labels, try to extract from the result directly
+        if 'expanded_query' in result:
+            labels = result
+        else:
+            fallback = get_fallback_analysis(messages)
+            fallback['warning'] = "Modal service returned unexpected format"
+            return fallback
+
+    expanded_query = labels.get('expanded_query', '')
+    if not expanded_query and messages:
+        expanded_query = messages[-1].get('content', '')
+
+    topic = labels.get('topic', {})
+    if not topic or 'level_1' not in topic:
+        topic = {'level_1': 'General', 'level_2': 'Other'}
+
+    return {
+        'expanded_query': expanded_query,
+        'topic': topic
+    }
+
+
+def interpret_exception(e: Exception, messages: list) -> dict:
+    """Turn an exception raised by the Modal call into an analysis dict."""
+    # Check if exception indicates Modal instance is not running
+    error_str = str(e).lower()
+    if 'not running' in error_str or 'not found' in error_str or 'connection' in error_str or 'timeout' in error_str:
+        return unavailable_analysis()
+    else:
+        fallback = get_fallback_analysis(messages)
+        fallback['warning'] = f"Error calling Modal service: {str(e)}"
+        return fallback
+
+
+def get_fallback_analysis(messages: list) -> dict:
+    """Fallback analysis if Modal service is unavailable."""
+    return get_fallback_analyses([messages])[0]
+
+
+def get_fallback_analyses(conversations: list) -> list:
+    """
+    Fallback analysis for a batch of conversations, tagging each by its last message.
+
+    Keyword matches are used first; queries with no keyword match go through
+    the local classifier in a single batch, if numpy is available.
+    """
+    METRICS.inc('fallback_analyses_total', len(conversations))
+    queries = [messages[-1].get('content', '') if messages else None for messages in conversations]
+    with METRICS.span('fallback_analysis'):
+        topics = get_keyword_index().classify_many(q or '' for q in queries)
+
+        unmatched = [i for i, topic in enumerate(topics) if topic is None and queries[i]]
+        classifier = local_classifier() if unmatched else None
+        if classifier is not None:
+            local_topics = classifier.classify_many(queries[i] for i in unmatched)
+            for i, topic in zip(unmatched, local_topics):
+                topics[i] = topic
+
+    analyses = []
+    for query, topic in zip(queries, topics):
+        if query is None:
+            analyses.append({
+                'expanded_query': '',
+                'topic': {'level_1': 'General', 'level_2': 'Other'}
+            })
+        else:
+            # Simple expanded query (just return the query as-is for fallback)
+            analyses.append({
+                'expanded_query': query,
+                'topic': topic or {'level_1': 'General', 'level_2': 'Chitchat'}
+            })
+    return analyses
+
+
+def warm_up_fallback():
+    """Build the keyword index and load the local classifier ahead of the first fallback."""
+    get_keyword_index()
+    local_classifier()
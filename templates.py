@@ -0,0 +1,213 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from keyword_index import get_keyword_index
+from topics import TOPIC_KEYWORDS
+
+INDEX_VERSION = 2
+TITLE_CHARS = 60
+TOKEN_RE = re.compile(r"\w+")
+TOPIC_LABELS = list(TOPIC_KEYWORDS)
+# Topic ids in a saved index are positions in TOPIC_LABELS
+LABELS_HASH = hashlib.sha256(json.dumps(TOPIC_LABELS).encode('utf-8')).hexdigest()
+
+
+def read_templates(path: str) -> list:
+    """Parse every non-blank line of a JSONL template file."""
+    templates = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                templates.append(json.loads(line))
+    return templates
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(text.lower())
+
+
+def template_title(template: dict) -> str:
+    """Short label for a template: its first user message, on one line."""
+    for message in template.get('messages', []):
+        if message.get('role') == 'user':
+            title = " ".join(message.get('content', '').split())
+            return title if len(title) <= TITLE_CHARS else title[:TITLE_CHARS - 1] + "…"
+    return "Untitled template"
+
+
+class TemplateLibrary:
+    """
+    Line-offset index over a JSONL template file.
+
+    The file is memory-mapped and only the byte offset of each non-blank line
+    is kept, together with a short title, a keyword topic and an inverted
+    word index for search. Templates are parsed on demand with `get()`.
+    The index is built once per file version and can be persisted next to
+    the file, so later processes skip the full parse. The saved index is a
+    JSON header line followed by raw array data - loading it never runs code.
+    """
+
+    def __init__(self, path: str, index_path: str = None):
+        self.path = path
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        # mmap refuses empty files
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self._signature = (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+
+        index = self._read_index(index_path) if index_path else None
+        if index is None:
+            index = self._build_index()
+            if index_path:
+                self._write_index(index_path, index)
+        self._starts, self._ends, self.titles, self._topics, self._postings = index
+        self._vocabulary = sorted(self._postings)
+        self._by_topic = {}
+        for template_id, label_id in enumerate(self._topics):
+            if label_id >= 0:
+                self._by_topic.setdefault(TOPIC_LABELS[label_id], array('I')).append(template_id)
+        self.get = lru_cache(maxsize=256)(self._parse)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _lines(self):
+        position = 0
+        size = len(self._data)
+        while position < size:
+            end = self._data.find(b"\n", position)
+            if end < 0:
+                end = size
+            if self._data[position:end].strip():
+                yield position, end
+            position = end + 1
+
+    def _build_index(self):
+        starts, ends, titles = array('Q'), array('Q'), []
+        postings = {}
+        texts = []
+        for template_id, (start, end) in enumerate(self._lines()):
+            template = json.loads(self._data[start:end])
+            starts.append(start)
+            ends.append(end)
+            titles.append(template_title(template))
+            messages = template.get('messages', [])
+            for token in set(tokenize(" ".join(m.get('content', '') for m in messages))):
+                postings.setdefault(token, array('I')).append(template_id)
+            texts.append(" ".join(m.get('content', '') for m in messages if m.get('role') == 'user'))
+
+        label_ids = {label: i for i, label in enumerate(TOPIC_LABELS)}
+        topics = array('h', (
+            label_ids[(topic['level_1'], topic['level_2'])] if topic else -1
+            for topic in get_keyword_index().classify_many(texts)
+        ))
+        return starts, ends, titles, topics, postings
+
+    def _header(self) -> dict:
+        version, size, mtime_ns = self._signature
+        return {'version': version, 'size': size, 'mtime_ns': mtime_ns, 'labels': LABELS_HASH,
+                'byteorder': sys.byteorder}
+
+    def _read_index(self, index_path: str):
+        try:
+            with open(index_path, 'rb') as f:
+                header = json.loads(f.readline())
+                if {k: header.get(k) for k in self._header()} != self._header():
+                    return None
+                arrays = []
+                for typecode, count in header['arrays']:
+                    values = array(typecode)
+                    values.fromfile(f, count)
+                    arrays.append(values)
+            starts, ends, topics, posting_counts, posting_ids = arrays
+            titles, vocabulary = header['titles'], header['vocabulary']
+            if not len(starts) == len(ends) == len(topics) == len(titles) or len(vocabulary) != len(posting_counts):
+                return None
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+        postings = {}
+        offset = 0
+        for token, count in zip(vocabulary, posting_counts):
+            postings[token] = posting_ids[offset:offset + count]
+            offset += count
+        return starts, ends, titles, topics, postings
+
+    def _write_index(self, index_path: str, index):
+        starts, ends, titles, topics, postings = index
+        vocabulary = sorted(postings)
+        posting_counts = array('I', (len(postings[token]) for token in vocabulary))
+        posting_ids = array('I')
+        for token in vocabulary:
+            posting_ids.extend(postings[token])
+        arrays = [starts, ends, topics, posting_counts, posting_ids]
+        header = dict(self._header(), titles=titles, vocabulary=vocabulary,
+                      arrays=[[a.typecode, len(a)] for a in arrays])
+
+        tmp_path = f"{index_path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b"\n")
+                for values in arrays:
+                    values.tofile(f)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass  # read-only deployment - rebuild on next start
+
+    def _parse(self, template_id: int) -> dict:
+        return json.loads(self._data[self._starts[template_id]:self._ends[template_id]])
+
+    def topic(self, template_id: int):
+        """Keyword topic of a template as a (level_1, level_2) pair, or None."""
+        label_id = self._topics[template_id]
+        return TOPIC_LABELS[label_id] if label_id >= 0 else None
+
+    def topics(self) -> list:
+        """Topics that at least one template belongs to, in TOPIC_KEYWORDS order."""
+        return [label for label in TOPIC_LABELS if label in self._by_topic]
+
+    def _matching(self, token: str, prefix: bool) -> set:
+        if not prefix:
+            return set(self._postings.get(token, ()))
+        ids = set()
+        i = bisect_left(self._vocabulary, token)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(token):
+            ids.update(self._postings[self._vocabulary[i]])
+            i += 1
+        return ids
+
+    def search(self, query: str = '', topic: tuple = None):
+        """
+        Ids of templates containing every word of `query` (the last word may be
+        a prefix, for search-as-you-type), optionally restricted to `topic`.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            if topic is None:
+                return range(len(self))
+            return self._by_topic.get(tuple(topic), array('I'))
+
+        ids = None
+        # Rarest exact words first keeps the intersections small
+        for token in sorted(tokens[:-1], key=lambda t: len(self._postings.get(t, ()))):
+            ids = self._matching(token, prefix=False) if ids is None else ids & self._matching(token, prefix=False)
+            if not ids:
+                return []
+        last = self._matching(tokens[-1], prefix=True)
+        ids = last if ids is None else ids & last
+        if topic is not None:
+            ids &= set(self._by_topic.get(tuple(topic), ()))
+        return sorted(ids)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
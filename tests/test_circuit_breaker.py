@@ -0,0 +1,70 @@
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(clock, **kwargs):
+    options = dict(failure_threshold=0.5, min_calls=4, open_seconds=5.0, max_open_seconds=20.0, clock=clock)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record_failure()
+
+
+def test_opens_once_failure_rate_reached():
+    breaker = make_breaker(FakeClock())
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_allows_a_single_probe():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.now = 5.0
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_failed_probe_doubles_backoff_up_to_max():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    retry_in = []
+    for _ in range(4):
+        retry_in.append(breaker.snapshot()['retry_in'])
+        clock.now += retry_in[-1]
+        assert breaker.allow()
+        breaker.record_failure()
+    assert retry_in == [5.0, 10.0, 20.0, 20.0]
+
+
+def test_successful_probe_closes_and_resets_backoff():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.now = 5.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.snapshot() == {'state': CLOSED, 'failure_rate': 0.0, 'retry_in': 0.0, 'consecutive_opens': 0}
+
+
+def test_trip_opens_immediately():
+    breaker = make_breaker(FakeClock())
+    breaker.trip()
+    assert breaker.state == OPEN
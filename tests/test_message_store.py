@@ -0,0 +1,32 @@
+from context_window import ContextPolicy, apply_context_policy, messages_needed, verbatim_messages
+from message_store import ConversationStore
+
+POLICY = ContextPolicy(recent_turns=4, max_tokens=2000, trim_turns=2)
+
+
+def conversation(count: int) -> list:
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"message {i} " * (i % 40 + 1)}
+            for i in range(count)]
+
+
+def test_context_tail_reads_no_spilled_rows(tmp_path):
+    store = ConversationStore(memory_window=4, spill_dir=str(tmp_path), keep_recent=verbatim_messages(POLICY),
+                              digest_chars=POLICY.compressed_chars, digest_count=messages_needed(POLICY))
+    messages = conversation(120)
+    store.extend(messages)
+    assert store.spilled
+
+    def load(start, stop):
+        raise AssertionError("read spilled rows")
+    store._load = load
+
+    needed = messages_needed(POLICY)
+    history = store.context_tail(needed)
+    assert apply_context_policy(history, POLICY) == apply_context_policy(messages[-needed:], POLICY)
+
+
+def test_spill_keeps_recent_messages_in_memory(tmp_path):
+    store = ConversationStore(memory_window=4, spill_dir=str(tmp_path), keep_recent=10)
+    store.extend(conversation(25))
+    assert len(store.recent()) >= 10
+    assert [m.content for m in store] == [m['content'] for m in conversation(25)]
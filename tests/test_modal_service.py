@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from modal_service import ModalServiceHandle
+from tests.test_circuit_breaker import FakeClock, open_breaker
+
+
+class FakeInfer:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+
+    def remote(self, messages):
+        self.calls += 1
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def make_handle(clock, infer, resolve=None):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=5.0, max_open_seconds=60.0, clock=clock)
+    service = SimpleNamespace(infer=infer)
+    return ModalServiceHandle(breaker, resolve=resolve or (lambda: service))
+
+
+def half_open(handle, clock):
+    clock.now += handle.breaker.snapshot()['retry_in']
+    assert handle.breaker.allow()
+
+
+def test_probe_closes_breaker_when_infer_succeeds():
+    clock = FakeClock()
+    infer = FakeInfer({'labels': {'expanded_query': 'ping'}})
+    handle = make_handle(clock, infer)
+    open_breaker(handle.breaker)
+    half_open(handle, clock)
+    assert handle.probe()
+    assert handle.breaker.state == CLOSED
+    assert infer.calls == 1
+
+
+def test_probe_keeps_breaker_open_when_lookup_works_but_infer_times_out():
+    clock = FakeClock()
+    handle = make_handle(clock, FakeInfer(TimeoutError("infer timed out")))
+    open_breaker(handle.breaker)
+    opens = []
+    for _ in range(3):
+        half_open(handle, clock)
+        assert not handle.probe()
+        assert handle.breaker.state == OPEN
+        opens.append(handle.breaker.snapshot()['retry_in'])
+    # The backoff keeps growing instead of resetting on the successful lookup
+    assert opens == [10.0, 20.0, 40.0]
+
+
+def test_probe_treats_error_result_as_failure():
+    clock = FakeClock()
+    handle = make_handle(clock, FakeInfer({'error': 'model not loaded'}))
+    open_breaker(handle.breaker)
+    half_open(handle, clock)
+    assert not handle.probe()
+    assert handle.breaker.state == OPEN
+
+
+def test_failed_lookup_trips_breaker_and_is_retried():
+    clock = FakeClock()
+    attempts = []
+
+    def resolve():
+        attempts.append(1)
+        raise ConnectionError("app not found")
+
+    handle = make_handle(clock, FakeInfer(None), resolve=resolve)
+    assert handle.get_service() is None
+    assert handle.breaker.state == OPEN
+    assert handle.get_service() is None
+    assert len(attempts) == 2
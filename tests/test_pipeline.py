@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from analysis_cache import AnalysisCache
+from circuit_breaker import HALF_OPEN, CircuitBreaker
+from context_window import ContextPolicy
+from modal_service import ModalServiceHandle
+from pipeline import AnalysisPipeline
+from tests.test_circuit_breaker import FakeClock, open_breaker
+
+MESSAGES = [{'role': 'user', 'content': 'how do interest rates affect inflation?'}]
+ANALYSIS = {'expanded_query': 'interest rates and inflation', 'topic': {'level_1': 'Finance', 'level_2': 'Economy'}}
+
+
+class HangingRemote:
+    async def aio(self, messages):
+        await asyncio.sleep(3600)
+
+
+def make_pipeline(clock, service):
+    handle = ModalServiceHandle(CircuitBreaker(min_calls=2, clock=clock), resolve=lambda: service)
+    return AnalysisPipeline(handle, AnalysisCache(), ContextPolicy(), ThreadPoolExecutor(max_workers=2))
+
+
+def half_open(pipeline, clock):
+    open_breaker(pipeline.handle.breaker)
+    clock.now += pipeline.handle.breaker.snapshot()['retry_in']
+    assert pipeline.handle.breaker.state == HALF_OPEN
+
+
+def test_cache_stats_count_one_miss_per_lookup():
+    service = SimpleNamespace(infer=SimpleNamespace(remote=lambda messages: {'labels': ANALYSIS}))
+    pipeline = make_pipeline(FakeClock(), service)
+    pipeline.analyze(MESSAGES)
+    pipeline.analyze(MESSAGES)
+    stats = pipeline.cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_leader_cache_hit_does_not_hold_the_probe_slot():
+    clock = FakeClock()
+    pipeline = make_pipeline(clock, service=None)
+    half_open(pipeline, clock)
+    # Another call cached the result between this caller's miss and its flight
+    messages, key, _ = pipeline._prepare(MESSAGES)
+    pipeline.cache.put(key, ANALYSIS)
+    assert pipeline._remote_analysis(key, messages) == ANALYSIS
+    assert pipeline.handle.breaker.allow()
+
+
+def test_cancelled_probe_gives_back_the_slot():
+    clock = FakeClock()
+    service = SimpleNamespace(infer=SimpleNamespace(remote=HangingRemote()))
+    pipeline = make_pipeline(clock, service)
+    pipeline.handle.get_service()
+    half_open(pipeline, clock)
+
+    async def run():
+        task = asyncio.create_task(pipeline.analyze_async(MESSAGES))
+        await asyncio.sleep(0.1)
+        assert not pipeline.handle.breaker.allow()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert pipeline.handle.breaker.allow()
@@ -0,0 +1,34 @@
+import json
+
+from templates import TemplateLibrary
+
+TEMPLATES = [
+    {'messages': [{'role': 'user', 'content': 'How do I budget for a new car?'}]},
+    {'messages': [{'role': 'user', 'content': 'What is the stock market doing today?'}]},
+    {'messages': [{'role': 'user', 'content': 'Tips for a budget trip to Japan'}]},
+]
+
+
+def write_templates(path):
+    path.write_text("\n".join(json.dumps(t) for t in TEMPLATES) + "\n", encoding='utf-8')
+
+
+def test_saved_index_matches_a_fresh_build(tmp_path):
+    path, index_path = tmp_path / 'templates.jsonl', tmp_path / 'templates.idx'
+    write_templates(path)
+    built = TemplateLibrary(str(path), index_path=str(index_path))
+    loaded = TemplateLibrary(str(path), index_path=str(index_path))
+    assert loaded.titles == built.titles
+    assert list(loaded.search('budg')) == list(built.search('budg')) == [0, 2]
+    assert loaded.topics() == built.topics()
+    assert loaded.get(1) == TEMPLATES[1]
+
+
+def test_unreadable_or_stale_index_is_rebuilt(tmp_path):
+    path, index_path = tmp_path / 'templates.jsonl', tmp_path / 'templates.idx'
+    write_templates(path)
+    for content in (b'', b'\x80\x04not an index', b'{"version": 2}\n', b'[]\n'):
+        index_path.write_bytes(content)
+        library = TemplateLibrary(str(path), index_path=str(index_path))
+        assert len(library) == len(TEMPLATES)
+        assert list(library.search('japan')) == [2]
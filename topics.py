@@ -0,0 +1,64 @@
+# Topic hierarchy
+TOPIC_HIERARCHY = {
+    "Politics": ["India", "UK", "USA", "China", "Russia", "Global"],
+    "Sports": ["Cricket", "Football", "Basketball", "Tennis", "Olympics"],
+    "Technology": ["Artificial Intelligence", "Machine Learning", "Software Development", "Cybersecurity", "Blockchain"],
+    "Business": ["Startups", "Finance", "Stock Market", "Economy", "E-commerce"],
+    "Entertainment": ["Movies", "TV Shows", "Music", "Celebrities", "OTT Platforms"],
+    "Science": ["Physics", "Biology", "Space", "Climate", "Research"],
+    "Health": ["Fitness", "Nutrition", "Mental Health", "Diseases", "Medicine"],
+    "Education": ["Exams", "Universities", "Online Courses", "Careers", "Research"],
+    "General": ["Chitchat", "Greetings", "Meta", "Clarification", "Other"]
+}
+
+# Keywords for the local fallback tagger, one entry per (level_1, level_2) pair.
+# Matching is case-insensitive on word boundaries and also accepts plurals,
+# so "movie" matches "Movies" but not "removie".
+TOPIC_KEYWORDS = {
+    ("Politics", "India"): ["india", "indian", "modi", "lok sabha", "rajya sabha", "bjp", "congress party", "prime minister of india", "delhi government"],
+    ("Politics", "UK"): ["uk", "britain", "british", "westminster", "downing street", "parliament", "tory", "labour party", "brexit"],
+    ("Politics", "USA"): ["usa", "united states", "white house", "congress", "senate", "president", "republican", "democrat", "supreme court"],
+    ("Politics", "China"): ["china", "chinese", "beijing", "xi jinping", "ccp", "taiwan"],
+    ("Politics", "Russia"): ["russia", "russian", "kremlin", "putin", "moscow", "ukraine"],
+    ("Politics", "Global"): ["election", "government", "minister", "policy", "diplomacy", "united nations", "nato", "geopolitic", "sanction", "treaty", "pm"],
+    ("Sports", "Cricket"): ["cricket", "ipl", "test match", "odi", "t20", "wicket", "batsman", "bowler", "virat kohli"],
+    ("Sports", "Football"): ["football", "soccer", "premier league", "la liga", "fifa", "world cup", "striker", "goalkeeper", "messi", "ronaldo"],
+    ("Sports", "Basketball"): ["basketball", "nba", "lebron", "dunk", "three-pointer"],
+    ("Sports", "Tennis"): ["tennis", "wimbledon", "grand slam", "us open", "djokovic", "nadal", "federer"],
+    ("Sports", "Olympics"): ["olympics", "olympic", "medal", "athlete", "paralympic"],
+    ("Technology", "Artificial Intelligence"): ["ai", "artificial intelligence", "chatgpt", "llm", "large language model", "gemini", "chatbot", "generative ai"],
+    ("Technology", "Machine Learning"): ["machine learning", "neural network", "deep learning", "model training", "dataset", "pytorch", "tensorflow", "regression", "classifier"],
+    ("Technology", "Software Development"): ["code", "coding", "programming", "software", "python", "javascript", "npm", "api", "bug", "debug", "github", "framework", "developer"],
+    ("Technology", "Cybersecurity"): ["cybersecurity", "security", "hacker", "hacking", "malware", "ransomware", "phishing", "password", "encryption", "vulnerability"],
+    ("Technology", "Blockchain"): ["blockchain", "crypto", "cryptocurrency", "bitcoin", "ethereum", "nft", "web3", "smart contract"],
+    ("Business", "Startups"): ["startup", "founder", "venture capital", "seed funding", "pitch deck", "unicorn", "incubator", "accelerator"],
+    ("Business", "Finance"): ["finance", "loan", "mortgage", "bank", "banking", "budget", "savings", "tax", "credit card", "interest rate", "investment"],
+    ("Business", "Stock Market"): ["stock", "stock market", "share price", "nasdaq", "sensex", "nifty", "dow jones", "s&p 500", "ipo", "dividend", "trading"],
+    ("Business", "Economy"): ["economy", "economic", "inflation", "gdp", "recession", "unemployment", "central bank", "tariff"],
+    ("Business", "E-commerce"): ["e-commerce", "ecommerce", "online store", "shopify", "amazon", "woocommerce", "dropshipping", "online shopping"],
+    ("Entertainment", "Movies"): ["movie", "film", "actor", "actress", "cinema", "box office", "hollywood", "bollywood", "director", "oscar"],
+    ("Entertainment", "TV Shows"): ["tv show", "tv series", "sitcom", "episode", "season finale", "television", "reality show"],
+    ("Entertainment", "Music"): ["music", "song", "album", "singer", "band", "concert", "spotify", "rapper", "lyrics"],
+    ("Entertainment", "Celebrities"): ["celebrity", "celebrities", "famous", "red carpet", "gossip", "influencer"],
+    ("Entertainment", "OTT Platforms"): ["netflix", "prime video", "disney+", "hotstar", "hbo max", "streaming service", "ott"],
+    ("Science", "Physics"): ["physics", "quantum", "relativity", "particle", "gravity", "electron", "thermodynamics", "einstein"],
+    ("Science", "Biology"): ["biology", "cell", "dna", "gene", "genetics", "evolution", "species", "marine life", "ecosystem", "organism"],
+    ("Science", "Space"): ["space", "nasa", "isro", "planet", "galaxy", "astronaut", "mars", "moon", "telescope", "black hole", "rocket"],
+    ("Science", "Climate"): ["climate", "climate change", "global warming", "carbon", "emission", "greenhouse", "sea level", "ice melt", "arctic", "heatwave"],
+    ("Science", "Research"): ["scientific research", "experiment", "scientist", "peer review", "research paper", "study", "hypothesis", "laboratory"],
+    ("Health", "Fitness"): ["fitness", "workout", "exercise", "gym", "yoga", "running", "weight loss", "cardio", "strength training"],
+    ("Health", "Nutrition"): ["nutrition", "diet", "protein", "vitamin", "calorie", "healthy eating", "vegan", "keto"],
+    ("Health", "Mental Health"): ["mental health", "anxiety", "depression", "stress", "therapy", "therapist", "burnout", "mindfulness"],
+    ("Health", "Diseases"): ["disease", "diabetes", "cancer", "covid", "infection", "virus", "symptom", "flu", "asthma"],
+    ("Health", "Medicine"): ["medicine", "doctor", "health", "medication", "drug", "vaccine", "hospital", "prescription", "treatment"],
+    ("Education", "Exams"): ["exam", "test prep", "jee", "neet", "upsc", "sat", "gre", "gmat", "ielts", "board exam"],
+    ("Education", "Universities"): ["university", "college", "campus", "admission", "degree", "iit", "harvard", "oxford", "scholarship"],
+    ("Education", "Online Courses"): ["online course", "coursera", "udemy", "edx", "mooc", "tutorial", "bootcamp", "certification"],
+    ("Education", "Careers"): ["career", "job", "resume", "interview", "internship", "salary", "hiring", "promotion"],
+    ("Education", "Research"): ["phd", "thesis", "dissertation", "academic research", "research proposal", "literature review", "professor"],
+    ("General", "Chitchat"): ["how are you", "bored", "joke", "lol", "what's up", "tell me something", "fun fact"],
+    ("General", "Greetings"): ["hi", "hello", "hey", "good morning", "good evening", "good night", "namaste", "greetings"],
+    ("General", "Meta"): ["who are you", "what are you", "are you a bot", "your name", "what can you do", "who made you", "are you human"],
+    ("General", "Clarification"): ["what do you mean", "clarify", "explain again", "elaborate", "rephrase", "i don't understand", "can you explain"],
+    ("General", "Other"): ["random", "miscellaneous", "anything else"],
+}